@@ -0,0 +1,43 @@
+"""
+Build the prebuilt artifacts loaded at cold start.
+
+Writes the resolver's substring matcher, the pycountry fuzzy-name index and the
+parsed map template to api/prebuilt/ as pickles. Each is tagged with a
+fingerprint of its inputs (COUNTRY_MAP, the pycountry databases, the map SVG)
+and of the source of the functions that build it; a stale artifact is ignored
+and rebuilt at runtime, so rerun this after changing any of them. requirements.txt pins pycountry to the version the
+committed fuzzy index was built with; upgrade it only together with a rebuild.
+
+Usage:
+    python api/build_artifacts.py
+"""
+import os
+import sys
+
+# Ensure the 'api' directory is in the path, as in main.py
+api_dir = os.path.dirname(os.path.abspath(__file__))
+if api_dir not in sys.path:
+    sys.path.insert(0, api_dir)
+
+import utils
+import widget
+
+
+def build_all():
+    """Build and save every artifact; return the written paths."""
+    artifacts = [
+        ("country_matcher", utils.matcher_fingerprint(),
+         lambda: utils.build_substring_matcher(utils.COUNTRY_MAP)),
+        ("fuzzy_index", utils.pycountry_fingerprint(), utils.build_fuzzy_index),
+        ("map_template", widget.map_template_fingerprint(), widget.build_map_template),
+    ]
+    paths = []
+    for name, fingerprint, build in artifacts:
+        path = utils.save_artifact(name, fingerprint, build())
+        print(f"{name}: {path} ({os.path.getsize(path) // 1024} KB)")
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    build_all()
@@ -0,0 +1,104 @@
+"""
+Heatmap color palettes.
+
+Counts are mapped to fill colors through lookup tables that are built once per
+(theme, max_count, scale, stops, counts present) and cached, so a render only
+indexes a dict. A table only holds the counts that occur in the data.
+"""
+import math
+from bisect import bisect_right
+from functools import lru_cache
+
+SCALES = ('log', 'linear', 'quantile')
+DEFAULT_SCALE = 'log'
+# Custom palettes accept between 2 and MAX_STOPS colors
+MAX_STOPS = 8
+
+# Color stops from the lowest to the highest count
+THEME_STOPS = {
+    'light': ((147, 197, 253), (30, 64, 175)),
+    # GitHub-inspired dark blue shades (#1f6feb to #58a6ff)
+    'dark': ((31, 111, 235), (88, 166, 255)),
+}
+# Fill for countries without contributors
+EMPTY_COLORS = {'light': '#ffffff', 'dark': '#1e293b'}
+
+
+def parse_stops(value):
+    """Parse 'rrggbb,rrggbb,...' (or 3-digit hex) into RGB tuples, or None if invalid."""
+    if not value:
+        return None
+    parts = [p.strip().lstrip('#') for p in value.split(',')]
+    if not 2 <= len(parts) <= MAX_STOPS:
+        return None
+    stops = []
+    for part in parts:
+        if len(part) == 3:
+            part = ''.join(ch * 2 for ch in part)
+        if len(part) != 6:
+            return None
+        try:
+            stops.append((int(part[0:2], 16), int(part[2:4], 16), int(part[4:6], 16)))
+        except ValueError:
+            return None
+    return tuple(stops)
+
+
+def interpolate(stops, intensity):
+    """Return the hex color at intensity (0..1) along the color stops."""
+    pos = intensity * (len(stops) - 1)
+    i = min(int(pos), len(stops) - 2)
+    frac = pos - i
+    (r0, g0, b0), (r1, g1, b1) = stops[i], stops[i + 1]
+    r = int(r0 + (r1 - r0) * frac)
+    g = int(g0 + (g1 - g0) * frac)
+    b = int(b0 + (b1 - b0) * frac)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def count_intensity(count, max_count, scale, values=None):
+    """Return the intensity (0..1) of a count from 1 to max_count on the scale."""
+    if scale == 'quantile' and values and len(values) > 1:
+        # Rank among the distinct counts present, so colors spread evenly
+        return max(bisect_right(values, count) - 1, 0) / (len(values) - 1)
+    if max_count <= 1:
+        return 0
+    if scale == 'linear':
+        return (count - 1) / (max_count - 1)
+    return math.log(count) / math.log(max_count) if count > 1 else 0
+
+
+@lru_cache(maxsize=256)
+def color_table(theme, max_count, scale=DEFAULT_SCALE, stops=None, values=()):
+    """
+    Return {count: fill color} for 0 (the empty fill) and each count in values.
+
+    ``values`` are the sorted distinct counts present, so a table holds at
+    most one entry per country however large the counts get. ``stops``
+    overrides the theme's colors.
+    """
+    stops = stops or THEME_STOPS[theme]
+    colors = {}
+    table = {0: EMPTY_COLORS[theme]}
+    for count in values:
+        intensity = count_intensity(count, max_count, scale, values)
+        # Counts often share a color; reuse the formatted string
+        color = colors.get(intensity)
+        if color is None:
+            color = colors[intensity] = interpolate(stops, intensity)
+        table[count] = color
+    return table
+
+
+def count_color(theme, count, max_count, scale=DEFAULT_SCALE, stops=None):
+    """Return the fill color of a single count, without building a table."""
+    if count == 0:
+        return EMPTY_COLORS[theme]
+    return interpolate(stops or THEME_STOPS[theme], count_intensity(count, max_count, scale))
+
+
+def get_palette(theme, country_counts, scale=DEFAULT_SCALE, stops=None):
+    """Return the color table for a set of country counts."""
+    max_count = max(country_counts.values()) if country_counts else 1
+    values = tuple(sorted(set(country_counts.values()) - {0}))
+    return color_table(theme, max_count, scale, stops, values)
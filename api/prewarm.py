@@ -0,0 +1,184 @@
+"""
+Offline cache pre-warmer.
+
+Fills repo_cache and user_locations for a list of repositories ahead of time,
+so the web tier only serves cached data. Users shared across repos are looked
+up once. Optionally pre-renders every variant/theme SVG to disk.
+
+Usage:
+    python api/prewarm.py repos.txt [--workers 8] [--budget 4000] [--render-dir out/]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Ensure the 'api' directory is in the path, as in main.py
+api_dir = os.path.dirname(os.path.abspath(__file__))
+if api_dir not in sys.path:
+    sys.path.insert(0, api_dir)
+
+import utils
+
+VARIANTS = ('list', 'map')
+THEMES = ('light', 'dark')
+# Stop early when GitHub reports fewer requests left than this
+MIN_RATE_LIMIT_REMAINING = 50
+
+
+def read_repos(path):
+    """Read owner/name lines, skipping blanks, comments and duplicates."""
+    repos = []
+    with open(path) as f:
+        for line in f:
+            repo = line.split('#', 1)[0].strip()
+            if repo and '/' in repo and repo not in repos:
+                repos.append(repo)
+    return repos
+
+
+def requests_spent(start):
+    return utils.github_stats["requests"] - start
+
+
+def budget_left(start, budget):
+    """Requests still allowed by --budget and by GitHub's reported rate limit."""
+    remaining = utils.github_stats["rate_limit_remaining"]
+    if remaining is not None and remaining < MIN_RATE_LIMIT_REMAINING:
+        return 0
+    if budget is None:
+        return float('inf')
+    return budget - requests_spent(start)
+
+
+def render_repo(repo, render_dir):
+    """Write every variant/theme SVG for a repo to render_dir from its stored snapshot."""
+    # Imported lazily: rendering pulls in Flask and lxml
+    from widget import render_map_with_list, render_map_only
+
+    # Never goes through get_all_contributors, which could start a crawl
+    country_counts = utils.get_stored_snapshot(repo)["counts"]
+    for variant in VARIANTS:
+        for theme in THEMES:
+            render = render_map_with_list if variant == 'list' else render_map_only
+            filename = f"{repo.replace('/', '__')}__{variant}__{theme}.svg"
+            with open(os.path.join(render_dir, filename), 'wb') as f:
+                f.write(render(country_counts, theme))
+
+
+def prewarm(repos, workers=8, budget=None, force=False, render_dir=None):
+    """
+    Warm the caches for repos and return the number of GitHub requests spent.
+
+    1. Revalidate contributor pages for every stale repo (in parallel),
+       checking the request budget before every page.
+    2. Look up all uncached users across those repos once, in chunks that
+       respect the request budget.
+    3. Store each repo entry (no further requests) and optionally render
+       the repos stored in this run.
+    """
+    start = utils.github_stats["requests"]
+    headers = utils.github_headers()
+    now = time.time()
+
+    stale = []
+    for repo in repos:
+        cached = utils.repo_cache.get(repo) or {}
+        if force or not cached or utils.repo_needs_refresh(cached, now):
+            stale.append(repo)
+    print(f"{len(repos)} repos, {len(stale)} need a refresh")
+
+    # 1. Contributor pages
+    pages_by_repo = {}
+    budget_lock = threading.Lock()
+    # Crawl threads with a page request in flight, counted against the budget
+    # until they ask for their next page
+    in_flight = set()
+
+    def crawl(repo):
+        refused = []
+
+        def may_fetch():
+            thread = threading.get_ident()
+            with budget_lock:
+                in_flight.discard(thread)
+                if budget_left(start, budget) - len(in_flight) <= 0:
+                    refused.append(True)
+                    return False
+                in_flight.add(thread)
+                return True
+
+        cached = utils.repo_cache.get(repo) or {}
+        try:
+            pages = utils.fetch_contributor_pages(repo, headers, cached.get("pages", []), may_fetch)
+        finally:
+            with budget_lock:
+                in_flight.discard(threading.get_ident())
+        if refused:
+            return repo, None, "skipped (request budget exhausted)"
+        return repo, pages, "failed (keeping the cached entry)"
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, (repo, pages, reason) in enumerate(pool.map(crawl, stale), 1):
+            if pages is None:
+                print(f"[{i}/{len(stale)}] {repo}: {reason}")
+                continue
+            pages_by_repo[repo] = pages
+            count = sum(len(p["contributors"]) for p in pages)
+            print(f"[{i}/{len(stale)}] {repo}: {count} contributors")
+
+    # 2. Users, deduplicated across repos
+    pending = {}
+    for pages in pages_by_repo.values():
+        utils.collect_pending_users([c for p in pages for c in p["contributors"]], now, pending)
+    print(f"{len(pending)} users need a location lookup")
+
+    # Chunks never exceed the remaining budget, even if every lookup falls back to REST
+    usernames = list(pending)
+    done = 0
+    while done < len(usernames):
+        left = budget_left(start, budget)
+        if left <= 0:
+            print(f"Request budget exhausted with {len(usernames) - done} users left")
+            break
+        chunk = usernames[done:done + int(min(left, utils.GRAPHQL_BATCH_SIZE))]
+        utils.store_missing_locations({u: pending[u] for u in chunk}, headers)
+        done += len(chunk)
+        print(f"  users {done}/{len(usernames)} ({requests_spent(start)} requests spent)")
+
+    # 3. Repo entries and renders
+    stored = []
+    for repo, pages in pages_by_repo.items():
+        cached = utils.repo_cache.get(repo) or {}
+        if budget_left(start, budget) <= 0 and utils.collect_pending_users(
+                [c for p in pages for c in p["contributors"]], time.time()):
+            # Storing now would spend requests on users skipped above
+            continue
+        utils.update_contributor_data(repo, cached, pages, headers, now)
+        stored.append(repo)
+
+    if render_dir:
+        os.makedirs(render_dir, exist_ok=True)
+        for repo in stored:
+            render_repo(repo, render_dir)
+        print(f"Rendered SVGs for {len(stored)} repos written to {render_dir}")
+
+    spent = requests_spent(start)
+    print(f"Done: {spent} GitHub requests spent, rate limit remaining: "
+          f"{utils.github_stats['rate_limit_remaining']}")
+    return spent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-warm heatmap caches for a list of repositories.")
+    parser.add_argument('repos_file', help="file with one owner/name per line")
+    parser.add_argument('--workers', type=int, default=utils.FETCH_WORKERS, help="parallel repo crawls")
+    parser.add_argument('--budget', type=int, default=None, help="max GitHub requests to spend")
+    parser.add_argument('--force', action='store_true', help="refresh repos even if still fresh")
+    parser.add_argument('--render-dir', default=None, help="also pre-render every variant/theme SVG here")
+    args = parser.parse_args()
+
+    prewarm(read_repos(args.repos_file), workers=args.workers, budget=args.budget,
+            force=args.force, render_dir=args.render_dir)
@@ -0,0 +1,106 @@
+"""
+Per-request profiling.
+
+profile_call runs a function under cProfile while a background thread samples
+the calling thread's stack, so one slow request yields both the top functions
+and its stacks in collapsed ("folded") format for flame graph tools.
+"""
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.001
+SORT_KEYS = ('tottime', 'cumtime', 'calls')
+
+
+def frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler(threading.Thread):
+    """
+    Periodically record the stack of one thread, counting identical stacks.
+
+    Frames from root_code outwards (the profiler's own caller chain) are left out.
+    """
+
+    def __init__(self, thread_id, root_code=None, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame.f_code is not self.root_code:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        """Stacks as 'outer;...;inner count' lines, most frequent first."""
+        return [f"{stack} {count}" for stack, count in
+                sorted(self.stacks.items(), key=lambda item: item[1], reverse=True)]
+
+
+def top_functions(profiler, limit, sort='tottime'):
+    """Summarize the profiler's heaviest functions."""
+    rows = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in pstats.Stats(profiler).stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "tottime_ms": round(tottime * 1000, 3),
+            "cumtime_ms": round(cumtime * 1000, 3),
+        })
+    key = {'tottime': "tottime_ms", 'cumtime': "cumtime_ms", 'calls': "calls"}.get(sort, "tottime_ms")
+    rows.sort(key=lambda row: row[key], reverse=True)
+    return rows[:limit]
+
+
+def profile_call(fn, top=30, sort='tottime'):
+    """Run fn under the profilers and return (result, report, profiler)."""
+    sampler = StackSampler(threading.get_ident(), profile_call.__code__)
+    profiler = cProfile.Profile()
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        result = profiler.runcall(fn)
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+
+    report = {
+        "total_ms": round(elapsed * 1000, 3),
+        "top_functions": top_functions(profiler, top, sort),
+        "samples": sampler.samples,
+        "collapsed_stacks": sampler.collapsed(),
+    }
+    return result, report, profiler
+
+
+def save_profile(report, profiler, directory, name):
+    """Write the JSON report and the raw cProfile stats (.prof) to directory; return their paths."""
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}")
+    with open(base + ".json", "w") as f:
+        json.dump(report, f, indent=2)
+    profiler.dump_stats(base + ".prof")
+    return [base + ".json", base + ".prof"]
@@ -1,15 +1,80 @@
 import os
 import json
 import time
+import hashlib
+import random
+import pickle
+import sqlite3
+import threading
+import unicodedata
+import importlib.util
 import requests
-import pycountry
+from requests.adapters import HTTPAdapter
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
 
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+# REST API root; point it at a stand-in server (tests/fake_github.py) for offline runs
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_GRAPHQL_URL = os.getenv("GITHUB_GRAPHQL_URL", f"{GITHUB_API_URL}/graphql")
+
+# GraphQL batching needs an authenticated request; set GITHUB_GRAPHQL=0 to force REST
+USE_GRAPHQL = os.getenv("GITHUB_GRAPHQL", "1") != "0"
+GRAPHQL_BATCH_SIZE = 100
+
+# Max number of user profile requests in flight at once. GitHub's secondary
+# rate limits penalize bursts of concurrent requests, so keep this small.
+FETCH_WORKERS = max(1, int(os.getenv("GITHUB_FETCH_WORKERS", 8)))
+# Upper bound (seconds) for honoring Retry-After / X-RateLimit-Reset from GitHub
+MAX_RETRY_AFTER = 60
+# Retries for transient GitHub failures (connection errors, 5xx, rate limits)
+MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", 3))
+# Base delay (seconds) for jittered exponential backoff
+RETRY_BACKOFF = 0.5
+REQUEST_TIMEOUT = 10
+# How long (seconds) a repo's contributor list is considered fresh
+REPO_CACHE_TTL = 86400
+# Refresh expired repos in a background thread while serving the stale data.
+# Off by default on Vercel, which freezes the function once the response is sent.
+BACKGROUND_REFRESH = os.getenv("BACKGROUND_REFRESH", "0" if os.getenv("VERCEL") else "1") != "0"
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", 2))
+# After a failed refresh, keep serving the cached entry and retry after this many seconds
+REFRESH_RETRY_DELAY = int(os.getenv("REFRESH_RETRY_DELAY", 300))
+# Also serialize crawls of the same repo across worker processes with a lock file
+CROSS_PROCESS_LOCK = os.getenv("CROSS_PROCESS_LOCK", "1") != "0"
+# Max seconds to wait for another process's crawl before serving the cached entry
+# (kept below gunicorn's default 30s worker timeout)
+REPO_LOCK_TIMEOUT = float(os.getenv("REPO_LOCK_TIMEOUT", 20))
+LOCK_POLL_INTERVAL = 0.1
+# How long (seconds) before re-checking users with no location, or whose lookup failed
+EMPTY_LOCATION_TTL = int(os.getenv("EMPTY_LOCATION_TTL", 7 * 86400))
+FAILED_LOOKUP_TTL = int(os.getenv("FAILED_LOOKUP_TTL", 3600))
+# Number of distinct location strings kept in the in-process resolution cache
+RESOLVE_CACHE_SIZE = int(os.getenv("RESOLVE_CACHE_SIZE", 4096))
 
 # Use /tmp for caching on Vercel (only writable directory)
 CACHE_DIR = "/tmp" if os.getenv("VERCEL") else "."
 CACHE_FILE = os.path.join(CACHE_DIR, "repo_cache.json")
 LOCATION_CACHE_FILE = os.path.join(CACHE_DIR, "user_locations.json")
+CACHE_DB_FILE = os.path.join(CACHE_DIR, "cache.sqlite3")
+# 'sqlite' (default) or 'json' for the legacy whole-file caches
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+# Decoded SQLite rows kept per table (LRU), to skip json.loads for hot keys
+DECODED_CACHE_SIZE = int(os.getenv("DECODED_CACHE_SIZE", 512))
+# Lookup tables and the map template built ahead of time by api/build_artifacts.py;
+# set PREBUILT_ARTIFACTS=0 to always build them at runtime
+PREBUILT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prebuilt")
+USE_PREBUILT = os.getenv("PREBUILT_ARTIFACTS", "1") != "0"
+# Bump when the layout of any prebuilt artifact changes
+ARTIFACT_VERSION = 1
 
 def load_json(filename):
     if os.path.exists(filename):
@@ -29,8 +94,214 @@ def save_json(filename, data):
         # Fail silently in read-only environments
         print(f"Warning: Could not save {filename}: {e}")
 
-repo_cache = load_json(CACHE_FILE)
-user_locations = load_json(LOCATION_CACHE_FILE)
+MISSING = object()
+
+
+class RepoUnavailable(Exception):
+    """Raised when a repo has nothing cached and its contributor list cannot be fetched."""
+
+
+class JsonCache:
+    """
+    Legacy cache backend: one JSON file, fully loaded at startup and fully
+    rewritten by save(). TTLs are not supported.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = load_json(filename)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def set(self, key, value, ttl=None):
+        self.data[key] = value
+
+    def update(self, items, ttl=None):
+        self.data.update(items)
+
+    def save(self):
+        save_json(self.filename, self.data)
+
+
+class SqliteCache:
+    """
+    Cache backend storing one JSON value per row in a shared SQLite database.
+
+    Writes are per-key upserts, so nothing is rewritten wholesale, and WAL mode
+    lets several worker processes read and write the same file safely. Rows
+    may carry an expiry time; expired rows read as missing and are deleted
+    when the cache is opened.
+    """
+
+    def __init__(self, path, table, legacy_file=None):
+        self.path = path
+        self.table = table
+        self.local = threading.local()
+        # Recently decoded values by key (LRU), reused while the row's updated_at is unchanged
+        self.decoded = OrderedDict()
+        self.decoded_lock = threading.Lock()
+
+        conn = self.connect()
+        with conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, expires_at REAL)"
+            )
+        if legacy_file and os.path.exists(legacy_file):
+            empty = conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+            if empty:
+                self.update(load_json(legacy_file))
+        self.purge_expired()
+
+    def connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def purge_expired(self):
+        """Delete expired rows."""
+        conn = self.connect()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),))
+
+    def get(self, key, default=None):
+        with self.decoded_lock:
+            memo = self.decoded.get(key)
+        row = self.connect().execute(
+            f"SELECT updated_at, expires_at, CASE WHEN updated_at = ? THEN NULL ELSE value END "
+            f"FROM {self.table} WHERE key = ?",
+            (memo[0] if memo else None, key),
+        ).fetchone()
+        if row is None:
+            return default
+        updated_at, expires_at, value = row
+        if expires_at is not None and expires_at < time.time():
+            return default
+        if value is None:
+            with self.decoded_lock:
+                if key in self.decoded:
+                    self.decoded.move_to_end(key)
+            return memo[1]
+        value = json.loads(value)
+        with self.decoded_lock:
+            self.decoded[key] = (updated_at, value)
+            self.decoded.move_to_end(key)
+            while len(self.decoded) > DECODED_CACHE_SIZE:
+                self.decoded.popitem(last=False)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key, value, ttl=None):
+        self.update({key: value}, ttl=ttl)
+
+    def update(self, items, ttl=None):
+        """Upsert many keys in a single transaction."""
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        rows = [(key, json.dumps(value), now, expires_at) for key, value in items.items()]
+        conn = self.connect()
+        with conn:
+            conn.executemany(
+                f"INSERT INTO {self.table} (key, value, updated_at, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                "updated_at = excluded.updated_at, expires_at = excluded.expires_at",
+                rows,
+            )
+        with self.decoded_lock:
+            for key in items:
+                self.decoded.pop(key, None)
+
+    def save(self):
+        # Every write is already committed
+        pass
+
+
+def artifact_path(name):
+    return os.path.join(PREBUILT_DIR, f"{name}.pickle")
+
+def load_artifact(name, fingerprint):
+    """Return a prebuilt artifact's data, or None if it is missing, disabled or out of date."""
+    if not USE_PREBUILT or fingerprint is None:
+        return None
+    try:
+        with open(artifact_path(name), "rb") as f:
+            artifact = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error loading prebuilt {name}: {e}")
+        return None
+    if artifact.get("fingerprint") != fingerprint:
+        return None
+    return artifact["data"]
+
+def code_fingerprint(*functions):
+    """
+    Hash the source of the functions that build an artifact, so editing them
+    invalidates artifacts built by the old code. None if the source is unavailable.
+    """
+    import inspect
+
+    digest = hashlib.sha1()
+    try:
+        for fn in functions:
+            digest.update(inspect.getsource(fn).encode("utf-8"))
+    except (OSError, TypeError):
+        return None
+    return digest.hexdigest()[:12]
+
+def matcher_fingerprint():
+    """Identify the COUNTRY_MAP tables and builder code a matcher artifact was built from."""
+    code = code_fingerprint(build_substring_matcher)
+    return f"{ARTIFACT_VERSION}:{RESOLVER_VERSION}:{code}" if code else None
+
+def save_artifact(name, fingerprint, data):
+    """Write an artifact atomically, tagged with the fingerprint of the data it was built from."""
+    os.makedirs(PREBUILT_DIR, exist_ok=True)
+    path = artifact_path(name)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump({"fingerprint": fingerprint, "data": data}, f, protocol=4)
+    os.replace(path + ".tmp", path)
+    return path
+
+def open_cache(table, legacy_file):
+    """Open a cache with the configured backend, falling back to JSON if SQLite is unusable."""
+    if CACHE_BACKEND == "sqlite":
+        try:
+            return SqliteCache(CACHE_DB_FILE, table, legacy_file=legacy_file)
+        except sqlite3.Error as e:
+            print(f"Warning: Could not open {CACHE_DB_FILE}: {e}")
+    return JsonCache(legacy_file)
+
+repo_cache = open_cache("repo_cache", CACHE_FILE)
+user_locations = open_cache("user_locations", LOCATION_CACHE_FILE)
 
 # Comprehensive mapping of location strings to ISO country codes.
 # Sorted by length (descending) to prioritize more specific matches.
@@ -119,8 +390,235 @@ COUNTRY_MAP = sorted([
     ("fiji", "fj"), ("suva", "fj"), ("papua new guinea", "pg"), ("port moresby", "pg"),
 ], key=lambda x: len(x[0]), reverse=True)
 
+def build_substring_matcher(entries):
+    """
+    Build an Aho-Corasick automaton over the COUNTRY_MAP keys.
+
+    Each node stores the lowest COUNTRY_MAP rank among the keys ending there
+    (including those reachable via failure links), so a single scan of a
+    location finds the same "longest key wins" match as a linear pass over
+    the sorted list.
+    """
+    goto = [{}]
+    fail = [0]
+    best = [None]
+
+    for rank, (key, _) in enumerate(entries):
+        node = 0
+        for ch in key:
+            nxt = goto[node].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[node][ch] = nxt
+                goto.append({})
+                fail.append(0)
+                best.append(None)
+            node = nxt
+        if best[node] is None:
+            best[node] = rank
+
+    # Breadth-first pass to set failure links and inherit matches
+    queue = list(goto[0].values())
+    for node in queue:
+        for ch, child in goto[node].items():
+            if node:
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(ch, 0)
+            inherited = best[fail[child]]
+            if inherited is not None and (best[child] is None or inherited < best[child]):
+                best[child] = inherited
+            queue.append(child)
+
+    return goto, fail, best
+
+# Exact lookup: first (longest, then list order) entry wins for duplicate keys
+COUNTRY_INDEX = {}
+for _key, _code in COUNTRY_MAP:
+    COUNTRY_INDEX.setdefault(_key, _code)
+
+_country_matcher = None
+
+def get_country_matcher():
+    """Load the substring matcher from its prebuilt artifact, building it if needed."""
+    global _country_matcher
+    if _country_matcher is None:
+        matcher = load_artifact("country_matcher", matcher_fingerprint())
+        _country_matcher = matcher if matcher is not None else build_substring_matcher(COUNTRY_MAP)
+    return _country_matcher
+
+def find_substring_match(text):
+    """Return the code of the highest-priority COUNTRY_MAP key contained in text."""
+    goto, fail, best = get_country_matcher()
+    node = 0
+    found = None
+    for ch in text:
+        while node and ch not in goto[node]:
+            node = fail[node]
+        node = goto[node].get(ch, 0)
+        rank = best[node]
+        if rank is not None and (found is None or rank < found):
+            found = rank
+    return COUNTRY_MAP[found][1] if found is not None else None
+
 LOCATION_BLOCKLIST = {"ci", "cd", "api", "bot", "n/a", "none", "unknown", "earth", "world", "internet", "remote"}
 
+_fuzzy_index = None
+
+def remove_accents(text):
+    """Strip combining accents, as pycountry.remove_accents does."""
+    if text.isascii():
+        return text
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+def pycountry_fingerprint():
+    """
+    Hash of the pycountry databases and the builder code the fuzzy index is
+    built from, without importing pycountry.
+    """
+    spec = importlib.util.find_spec("pycountry")
+    code = code_fingerprint(build_fuzzy_index, remove_accents)
+    if spec is None or not spec.origin or code is None:
+        return None
+    digest = hashlib.sha1(f"{ARTIFACT_VERSION}:{code}".encode())
+    db_dir = os.path.join(os.path.dirname(spec.origin), "databases")
+    try:
+        for name in ("iso3166-1.json", "iso3166-2.json"):
+            with open(os.path.join(db_dir, name), "rb") as f:
+                digest.update(f.read())
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def build_fuzzy_index():
+    """
+    Build normalized pycountry name tables.
+
+    These hold the same data pycountry.countries.search_fuzzy scans on every
+    call, lowercased and accent-stripped ahead of time. pycountry (and its
+    JSON databases) is only loaded here.
+    """
+    import pycountry
+
+    countries = []
+    country_names = []
+    for country in pycountry.countries:
+        names = []
+        for field in ("name", "official_name", "comment"):
+            v = getattr(country, field, None)
+            if v is not None:
+                initials = remove_accents("".join(c for c in v if c.isupper()).lower())
+                names.append((initials, remove_accents(v.lower())))
+        countries.append((country.alpha_2, names))
+        country_names.append((country.name.lower(), country.alpha_2.lower()))
+
+    # Same precedence as pycountry.countries.lookup: indexed fields in index
+    # order, then non-indexed fields in database order
+    country_lookup = {}
+    for field_index in pycountry.countries.indices.values():
+        for value, country in field_index.items():
+            country_lookup.setdefault(value, country.alpha_2)
+    for country in pycountry.countries:
+        for field in pycountry.countries.no_index:
+            v = country._fields.get(field)
+            if v is not None:
+                country_lookup.setdefault(v.lower(), country.alpha_2)
+
+    subdivision_exact = {}
+    subdivision_names = []
+    subdivision_codes = []
+    for sub in pycountry.subdivisions:
+        for v in sub._fields.values():
+            if v is not None:
+                for w in set(remove_accents(v.lower()).split(";")):
+                    subdivision_exact.setdefault(w, []).append(sub.country_code)
+        subdivision_names.append(remove_accents(sub.name.lower()))
+        subdivision_codes.append(sub.country_code)
+
+    # All subdivision names in one string so partial matches use str.find
+    separator = "\n"
+    starts = []
+    offset = 0
+    for name in subdivision_names:
+        starts.append(offset)
+        offset += len(name) + len(separator)
+
+    return {
+        "countries": countries,
+        "country_names": country_names,
+        "country_lookup": country_lookup,
+        "subdivision_exact": subdivision_exact,
+        "subdivision_names": subdivision_names,
+        "subdivision_codes": subdivision_codes,
+        "subdivision_text": separator.join(subdivision_names),
+        "subdivision_starts": starts,
+        "separator": separator,
+    }
+
+def get_fuzzy_index():
+    """Load the fuzzy name index (once per process) from its prebuilt artifact, building it if needed."""
+    global _fuzzy_index
+    if _fuzzy_index is None:
+        index = load_artifact("fuzzy_index", pycountry_fingerprint())
+        _fuzzy_index = index if index is not None else build_fuzzy_index()
+    return _fuzzy_index
+
+@lru_cache(maxsize=RESOLVE_CACHE_SIZE)
+def fuzzy_country_code(query):
+    """
+    Same result as pycountry.countries.search_fuzzy(query)[0], using the
+    precomputed name index. Returns None when nothing matches; misses are
+    cached like hits so unresolvable strings are cheap on repeat.
+    """
+    index = get_fuzzy_index()
+    query = remove_accents(query.strip().lower())
+    results = {}
+
+    def add_result(alpha_2, points):
+        results[alpha_2] = results.get(alpha_2, 0) + points
+
+    # Prio 1: exact matches on country names and codes
+    alpha_2 = index["country_lookup"].get(query)
+    if alpha_2:
+        add_result(alpha_2, 50)
+
+    # Prio 2: exact matches on subdivision names
+    for alpha_2 in index["subdivision_exact"].get(query, ()):
+        add_result(alpha_2, 49)
+
+    # Prio 3: initials or partial matches on country names
+    for alpha_2, names in index["countries"]:
+        for initials, name in names:
+            if query == initials:
+                add_result(alpha_2, 40)
+                break
+            if query in name:
+                add_result(alpha_2, max(5, 30 - 2 * name.find(query)))
+                break
+
+    # Prio 4: partial matches on subdivision names
+    names = index["subdivision_names"]
+    codes = index["subdivision_codes"]
+    if index["separator"] in query:
+        for name, alpha_2 in zip(names, codes):
+            if query in name:
+                add_result(alpha_2, max(1, 5 - name.find(query)))
+    else:
+        text = index["subdivision_text"]
+        starts = index["subdivision_starts"]
+        pos = text.find(query)
+        while pos != -1:
+            i = bisect_right(starts, pos) - 1
+            add_result(codes[i], max(1, 5 - (pos - starts[i])))
+            if i + 1 == len(starts):
+                break
+            pos = text.find(query, starts[i + 1])
+
+    if not results:
+        return None
+    return min(results.items(), key=lambda x: (-x[1], x[0]))[0].lower()
+
 def resolve_country_code(location):
     if not location: return None
     loc_lower = location.lower().strip()
@@ -130,14 +628,14 @@ def resolve_country_code(location):
         return None
     
     # 1. Direct match in COUNTRY_MAP
-    for key, code in COUNTRY_MAP:
-        if key == loc_lower:
-            return code
+    code = COUNTRY_INDEX.get(loc_lower)
+    if code:
+        return code
 
     # 2. Substring match in COUNTRY_MAP (e.g. "Espoo region, Finland")
-    for key, code in COUNTRY_MAP:
-        if key in loc_lower:
-            return code
+    code = find_substring_match(loc_lower)
+    if code:
+        return code
 
     # 3. Split by common separators and check parts
     parts = [p.strip() for p in loc_lower.replace(",", " ").split() if p.strip()]
@@ -145,81 +643,710 @@ def resolve_country_code(location):
     # Check parts from end to beginning (usually Country is at the end)
     for part in reversed(parts):
         # Exact match for part in COUNTRY_MAP
-        for key, code in COUNTRY_MAP:
-            if key == part:
-                return code
+        code = COUNTRY_INDEX.get(part)
+        if code:
+            return code
         
-        # Try pycountry on this part
-        try:
-            results = pycountry.countries.search_fuzzy(part)
-            if results:
-                return results[0].alpha_2.lower()
-        except:
-            pass
+        # Try pycountry's fuzzy search on this part
+        code = fuzzy_country_code(part)
+        if code:
+            return code
 
     # 4. Fallback search on full string
-    try:
-        results = pycountry.countries.search_fuzzy(location)
-        if results:
-            return results[0].alpha_2.lower()
-    except:
-        for country in pycountry.countries:
-            if country.name.lower() in loc_lower:
-                return country.alpha_2.lower()
+    code = fuzzy_country_code(location)
+    if code:
+        return code
+    for name, code in get_fuzzy_index()["country_names"]:
+        if name in loc_lower:
+            return code
     
     return None
 
-def get_all_contributors(repo_name, force_refresh=False):
-    """Fetch all contributors by paginating through GitHub API."""
-    now = time.time()
-    
-    if not force_refresh and repo_name in repo_cache and now - repo_cache[repo_name]["timestamp"] < 86400:
-        return repo_cache[repo_name]["data"]
+# Changes whenever the resolver tables change, invalidating persisted country codes
+RESOLVER_VERSION = hashlib.sha1(
+    repr((COUNTRY_MAP, sorted(LOCATION_BLOCKLIST))).encode("utf-8")
+).hexdigest()[:12]
 
-    headers = {"Accept": "application/vnd.github+json"}
-    if GITHUB_TOKEN:
-        headers["Authorization"] = f"token {GITHUB_TOKEN}"
+resolve_country_code_cached = lru_cache(maxsize=RESOLVE_CACHE_SIZE)(resolve_country_code)
+
+def make_location_entry(location, status=None, checked=None):
+    """
+    Build a user_locations entry holding the raw location and its resolved country.
+
+    status is "found", "empty" (confirmed no location) or "failed" (lookup
+    error); checked is when GitHub was last asked.
+    """
+    if status is None:
+        status = "found" if location else "empty"
+    return {
+        "location": location,
+        "country": resolve_country_code_cached(location),
+        "resolver": RESOLVER_VERSION,
+        "status": status,
+        "checked": time.time() if checked is None else checked,
+    }
+
+def get_location_expiry(entry):
+    """Return when an entry should be re-checked, or None if it never expires."""
+    status = entry.get("status")
+    if status == "failed":
+        return entry.get("checked", 0) + FAILED_LOOKUP_TTL
+    if status == "empty" or (status is None and not entry.get("location")):
+        return entry.get("checked", 0) + EMPTY_LOCATION_TTL
+    return None
+
+def location_needs_check(entry, now):
+    """True if a user's location is unknown or its negative result has expired."""
+    if entry is MISSING or not isinstance(entry, dict):
+        # Not cached yet, or a legacy bare value without a timestamp
+        return entry is MISSING or not entry
+    expiry = get_location_expiry(entry)
+    return expiry is not None and expiry <= now
+
+def get_location_entry(username):
+    """Return the cached entry for a user, upgrading legacy or stale entries in place."""
+    entry = user_locations.get(username, MISSING)
+    if entry is MISSING:
+        # Lookup failed: treat as unknown for now without caching it
+        return make_location_entry(None, status="failed")
+    if not isinstance(entry, dict):
+        # Legacy cache format stored the raw location string (or None)
+        entry = make_location_entry(entry, checked=0)
+        user_locations[username] = entry
+    elif entry.get("resolver") != RESOLVER_VERSION:
+        entry = make_location_entry(entry.get("location"), entry.get("status"), entry.get("checked", 0))
+        user_locations[username] = entry
+    return entry
+
+def get_user_country(user):
+    """Return a contributor's country code, reusing the persisted result when still valid."""
+    if user.get("resolver") == RESOLVER_VERSION:
+        return user.get("country")
+    return resolve_country_code_cached(user.get("location"))
+
+# One pooled keep-alive session shared by all GitHub calls (and worker threads)
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(10, FETCH_WORKERS * 2))
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
+def get_retry_delay(resp, attempt):
+    """
+    Seconds to wait before retrying a response, or None if it should not be retried.
+
+    Honors Retry-After (secondary rate limits) and X-RateLimit-Reset (primary
+    rate limit), otherwise backs off exponentially with full jitter.
+    """
+    backoff = random.uniform(0, RETRY_BACKOFF * (2 ** attempt))
+    if resp is None or resp.status_code >= 500:
+        return backoff
+    if resp.status_code not in (403, 429):
+        return None
+
+    retry_after = resp.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            return backoff
+    if resp.headers.get("X-RateLimit-Remaining") == "0":
+        reset = resp.headers.get("X-RateLimit-Reset")
+        try:
+            return max(0.0, float(reset) - time.time()) + 1
+        except (TypeError, ValueError):
+            return backoff
+    return backoff if resp.status_code == 429 else None
+
+# Requests sent to GitHub by this process, and the last rate-limit budget it reported
+github_stats = {"requests": 0, "rate_limit_remaining": None}
+github_stats_lock = threading.Lock()
+
+# Per-process instrumentation: total time and calls per stage, and cache
+# lookups by result. Stages are also collected per request (per thread) for
+# the Server-Timing header once start_request_timings() has been called.
+stage_totals = {}
+cache_counters = {}
+metrics_lock = threading.Lock()
+request_timings = threading.local()
+
+def start_request_timings():
+    """Start collecting stage timings for the current thread's request."""
+    request_timings.stages = []
+
+def get_request_timings():
+    """Return [(stage, seconds), ...] recorded for the current request."""
+    return getattr(request_timings, "stages", None) or []
+
+def record_stage(stage, seconds):
+    with metrics_lock:
+        totals = stage_totals.setdefault(stage, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+    stages = getattr(request_timings, "stages", None)
+    if stages is not None:
+        stages.append((stage, seconds))
+
+@contextmanager
+def timed(stage):
+    """Record how long the enclosed block takes under stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def count_cache(cache, result, n=1):
+    """Count n lookups in cache with result ('hit', 'miss', ...)."""
+    if n:
+        with metrics_lock:
+            cache_counters[(cache, result)] = cache_counters.get((cache, result), 0) + n
+
+def format_metrics(gauges=None):
+    """Render the counters in the Prometheus text exposition format."""
+    with metrics_lock:
+        stages = {stage: list(totals) for stage, totals in stage_totals.items()}
+        caches = dict(cache_counters)
+    info = resolve_country_code_cached.cache_info()
+    caches[("resolve", "hit")] = info.hits
+    caches[("resolve", "miss")] = info.misses
+
+    lines = [
+        "# HELP heatmap_stage_seconds Time spent per processing stage.",
+        "# TYPE heatmap_stage_seconds summary",
+    ]
+    for stage, (count, seconds) in sorted(stages.items()):
+        lines.append(f'heatmap_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines.append(f'heatmap_stage_seconds_sum{{stage="{stage}"}} {seconds:.6f}')
+    lines += [
+        "# HELP heatmap_cache_requests_total Cache lookups by cache and result.",
+        "# TYPE heatmap_cache_requests_total counter",
+    ]
+    for (cache, result), count in sorted(caches.items()):
+        lines.append(f'heatmap_cache_requests_total{{cache="{cache}",result="{result}"}} {count}')
+    lines += [
+        "# HELP heatmap_github_requests_total Requests sent to the GitHub API.",
+        "# TYPE heatmap_github_requests_total counter",
+        f"heatmap_github_requests_total {github_stats['requests']}",
+    ]
+    if github_stats["rate_limit_remaining"] is not None:
+        lines += [
+            "# HELP heatmap_github_rate_limit_remaining Last X-RateLimit-Remaining reported by GitHub.",
+            "# TYPE heatmap_github_rate_limit_remaining gauge",
+            f"heatmap_github_rate_limit_remaining {github_stats['rate_limit_remaining']}",
+        ]
+    for name, (help_text, value) in sorted((gauges or {}).items()):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+def github_request(method, url, **kwargs):
+    """
+    Send a request through the shared session, retrying transient failures.
+
+    Returns the final response, or raises the last connection error once
+    retries are exhausted. Waits longer than MAX_RETRY_AFTER are not slept
+    through; the rate-limited response is returned instead.
+    """
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+    for attempt in range(MAX_RETRIES + 1):
+        with github_stats_lock:
+            github_stats["requests"] += 1
+        try:
+            resp = session.request(method, url, **kwargs)
+            error = None
+        except requests.RequestException as e:
+            resp, error = None, e
+
+        if resp is not None and "X-RateLimit-Remaining" in resp.headers:
+            try:
+                github_stats["rate_limit_remaining"] = int(resp.headers["X-RateLimit-Remaining"])
+            except ValueError:
+                pass
+
+        delay = get_retry_delay(resp, attempt)
+        if delay is None or attempt == MAX_RETRIES or delay > MAX_RETRY_AFTER:
+            break
+        time.sleep(delay)
+
+    if error is not None:
+        raise error
+    return resp
+
+def fetch_user_location(url, headers):
+    """
+    Fetch a user's self-reported location (None if they have none).
+
+    Returns MISSING when the lookup failed after retries, so the caller does
+    not cache a transient failure as "no location".
+    """
+    try:
+        resp = github_request("GET", url, headers=headers)
+    except requests.RequestException as e:
+        print(f"Error fetching {url}: {e}")
+        return MISSING
+
+    if resp.status_code == 200:
+        return resp.json().get("location")
+    if resp.status_code in (404, 410):
+        # Deleted or renamed account: a confirmed empty result
+        return None
+    return MISSING
+
+def fetch_locations_graphql(logins, headers):
+    """
+    Fetch locations for a batch of logins with one aliased GraphQL query.
+
+    Returns {login: location} for the logins GitHub resolved. Logins missing
+    from the result (unknown users, errors) should be retried over REST.
+    """
+    variables = {f"l{i}": login for i, login in enumerate(logins)}
+    params = ", ".join(f"$l{i}: String!" for i in range(len(logins)))
+    fields = " ".join(f"u{i}: user(login: $l{i}) {{ location }}" for i in range(len(logins)))
+    query = f"query({params}) {{ {fields} }}"
+
+    try:
+        resp = github_request("POST", GITHUB_GRAPHQL_URL, json={"query": query, "variables": variables},
+                              headers=headers)
+        if resp.status_code != 200:
+            return {}
+        data = resp.json().get("data") or {}
+    except Exception as e:
+        print(f"Error fetching GraphQL user batch: {e}")
+        return {}
+
+    results = {}
+    for i, login in enumerate(logins):
+        user = data.get(f"u{i}")
+        if user is not None:
+            results[login] = user.get("location")
+    return results
+
+def fetch_missing_locations(pending, headers):
+    """
+    Fetch locations for {username: profile_url}.
+
+    Uses GraphQL batches when authenticated, then falls back to concurrent
+    REST lookups for anything the batches did not resolve. Users whose lookup
+    failed are left out of the result.
+    """
+    results = {}
+    logins = list(pending)
+
+    if USE_GRAPHQL and "Authorization" in headers:
+        batches = [logins[i:i + GRAPHQL_BATCH_SIZE] for i in range(0, len(logins), GRAPHQL_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+            for batch_results in pool.map(lambda batch: fetch_locations_graphql(batch, headers), batches):
+                results.update(batch_results)
+
+    rest = [username for username in logins if username not in results]
+    if rest:
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+            locations = pool.map(lambda username: fetch_user_location(pending[username], headers), rest)
+            for username, location in zip(rest, locations):
+                if location is not MISSING:
+                    results[username] = location
+
+    return results
 
-    contributors = []
+def fetch_contributor_pages(repo_name, headers, cached_pages, may_fetch=None):
+    """
+    Paginate /repos/{repo}/contributors, revalidating cached pages by ETag.
+
+    Pages answered with 304 Not Modified (which do not count against the rate
+    limit) are reused from cached_pages; only changed pages are downloaded.
+    Returns None if any page could not be fetched, so a partial list is never
+    stored in place of the cached one. may_fetch, if given, is called before
+    each page request; returning False stops the crawl the same way.
+    """
+    pages = []
     page = 1
     while True:
-        url = f"https://api.github.com/repos/{repo_name}/contributors?per_page=100&page={page}"
+        url = f"{GITHUB_API_URL}/repos/{repo_name}/contributors?per_page=100&page={page}"
+        cached_page = cached_pages[page - 1] if page <= len(cached_pages) else None
+        page_headers = dict(headers)
+        if cached_page and cached_page.get("etag"):
+            page_headers["If-None-Match"] = cached_page["etag"]
+        if may_fetch is not None and not may_fetch():
+            return None
         try:
-            resp = requests.get(url, headers=headers, timeout=10)
-            if resp.status_code != 200:
-                break
-            data = resp.json()
+            resp = github_request("GET", url, headers=page_headers)
+            if resp.status_code == 304 and cached_page:
+                data = cached_page["contributors"]
+                etag = cached_page["etag"]
+            elif resp.status_code == 200:
+                data = [{"login": c["login"], "url": c["url"]} for c in resp.json()]
+                etag = resp.headers.get("ETag")
+            elif resp.status_code == 204 or (resp.status_code == 404 and page == 1):
+                # Empty or deleted repository: a confirmed empty list
+                data = []
+            else:
+                print(f"Error fetching contributors for {repo_name}: HTTP {resp.status_code}")
+                return None
             if not data:
                 break
-            contributors.extend(data)
+            pages.append({"etag": etag, "contributors": data})
             if len(data) < 100:
                 break
             page += 1
         except Exception as e:
             print(f"Error fetching contributors: {e}")
-            break
+            return None
+    return pages
 
-    users_data = []
+def github_headers():
+    """Headers for GitHub API calls, authenticated when a token is configured."""
+    headers = {"Accept": "application/vnd.github+json"}
+    if GITHUB_TOKEN:
+        headers["Authorization"] = f"token {GITHUB_TOKEN}"
+    return headers
+
+def collect_pending_users(contributors, now, pending=None):
+    """Add uncached or expired users to pending as {username: profile_url}."""
+    if pending is None:
+        pending = {}
     for c in contributors:
         username = c['login'].lower()
-        if username in user_locations:
-            location = user_locations[username]
-        else:
-            try:
-                u_resp = requests.get(c['url'], headers=headers, timeout=10)
-                location = None
-                if u_resp.status_code == 200:
-                    location = u_resp.json().get("location")
-                    user_locations[username] = location
-                else:
-                    user_locations[username] = None
-            except:
-                user_locations[username] = None
-        
-        users_data.append({"login": username, "location": location})
+        if username not in pending and location_needs_check(user_locations.get(username, MISSING), now):
+            pending[username] = c['url']
+    return pending
+
+def store_missing_locations(pending, headers):
+    """Fetch locations for pending users and cache them; failures get a short-lived entry."""
+    with timed("github_users"):
+        found = fetch_missing_locations(pending, headers)
+    with timed("resolve"):
+        entries = {
+            username: make_location_entry(found[username]) if username in found
+            else make_location_entry(None, status="failed")
+            for username in pending
+        }
+    # Negative results expire from the store as well, so they are eventually purged
+    for status, ttl in (("found", None), ("empty", EMPTY_LOCATION_TTL), ("failed", FAILED_LOOKUP_TTL)):
+        group = {username: entry for username, entry in entries.items() if entry["status"] == status}
+        if group:
+            user_locations.update(group, ttl=ttl)
+
+def update_contributor_data(repo_name, cached, pages, headers, timestamp):
+    """
+    Look up new or expired user locations and store the repo entry.
+
+    recheck_at records when the earliest negative location result in the repo
+    expires, so a fresh entry can still re-check those users lazily.
+    """
+    now = time.time()
+    contributors = [c for p in pages for c in p["contributors"]]
+
+    # Collect uncached or expired users and fetch their locations in bulk
+    pending = collect_pending_users(contributors, now)
+    count_cache("location", "hit", len(contributors) - len(pending))
+    count_cache("location", "miss", len(pending))
+    if pending:
+        store_missing_locations(pending, headers)
+
+    users_data = []
+    recheck_at = None
+    # Cached entries from older resolver versions are re-resolved here
+    with timed("resolve"):
+        for c in contributors:
+            username = c['login'].lower()
+            entry = get_location_entry(username)
+            expiry = get_location_expiry(entry)
+            if expiry is not None and (recheck_at is None or expiry < recheck_at):
+                recheck_at = expiry
+            users_data.append({
+                "login": username,
+                "location": entry["location"],
+                "country": entry["country"],
+                "resolver": entry["resolver"],
+            })
 
-    save_json(LOCATION_CACHE_FILE, user_locations)
-    repo_cache[repo_name] = {"timestamp": now, "data": users_data}
-    save_json(CACHE_FILE, repo_cache)
+    user_locations.save()
+    repo_entry = {"timestamp": timestamp, "updated": now, "pages": pages, "data": users_data,
+                  "recheck_at": recheck_at}
+    if users_data == cached.get("data"):
+        # Nothing changed: keep the data version so snapshots and renders stay valid
+        repo_entry["updated"] = cached.get("updated", cached["timestamp"])
+        if "snapshot" in cached:
+            repo_entry["snapshot"] = cached["snapshot"]
+    repo_cache[repo_name] = repo_entry
+    repo_cache.save()
     
     return users_data
+
+def repo_needs_refresh(cached, now):
+    """True if a cached repo entry has expired or has location results due for a re-check."""
+    retry_at = cached.get("retry_at")
+    if retry_at is not None and now < retry_at:
+        # The last refresh failed; keep serving this entry until the retry time
+        return False
+    if now - cached["timestamp"] >= REPO_CACHE_TTL:
+        return True
+    recheck_at = cached.get("recheck_at")
+    return recheck_at is not None and now >= recheck_at and "pages" in cached
+
+def refresh_contributors(repo_name, cached, force_refresh=False):
+    """
+    Bring a repo entry up to date.
+
+    Expired (or forced) entries are revalidated page by page with ETags, so
+    only changed pages are re-downloaded and only new users need a location
+    lookup. Within the 24h window, only users whose negative location result
+    has expired are re-checked, without re-crawling the contributor list.
+
+    If the contributor list cannot be fetched, the cached entry is kept as is
+    and only its next attempt is pushed back by REFRESH_RETRY_DELAY; with no
+    cached entry, RepoUnavailable is raised and nothing is stored.
+    """
+    now = time.time()
+    headers = github_headers()
+    if not force_refresh and cached and "pages" in cached and now - cached["timestamp"] < REPO_CACHE_TTL:
+        return update_contributor_data(repo_name, cached, cached["pages"], headers, cached["timestamp"])
+
+    with timed("github_contributors"):
+        pages = fetch_contributor_pages(repo_name, headers, cached.get("pages", []))
+    if pages is None:
+        if not cached:
+            raise RepoUnavailable(f"Could not fetch the contributors of {repo_name}")
+        repo_cache[repo_name] = dict(cached, retry_at=now + REFRESH_RETRY_DELAY)
+        repo_cache.save()
+        return cached["data"]
+    return update_contributor_data(repo_name, cached, pages, headers, now)
+
+inflight = {}
+inflight_lock = threading.Lock()
+
+def single_flight(key, fn):
+    """
+    Run fn once per key at a time in this process.
+
+    Callers arriving while a call for the same key is running wait for it and
+    share its result (or exception) instead of repeating the work.
+    """
+    with inflight_lock:
+        future = inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            inflight[key] = future
+
+    if not leader:
+        return future.result()
+
+    try:
+        result = fn()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with inflight_lock:
+            inflight.pop(key, None)
+
+def acquire_lock_file(path, deadline):
+    """
+    Open and exclusively lock path, polling until deadline.
+
+    Returns the locked file, or None if it is still held by another process at
+    the deadline. The holder deletes the file on release; a waiter that locked
+    a deleted file opens the current one and tries again.
+    """
+    while True:
+        lock_file = open(path, "a")
+        try:
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        lock_file.close()
+                        return None
+                    time.sleep(LOCK_POLL_INTERVAL)
+            try:
+                if os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+        except BaseException:
+            lock_file.close()
+            raise
+        lock_file.close()
+
+@contextmanager
+def repo_file_lock(repo_name, timeout=None):
+    """
+    Hold an exclusive per-repo lock file so only one process crawls a repo at a time.
+
+    Yields True once the lock is held, or False if another process still held
+    it after timeout seconds (REPO_LOCK_TIMEOUT by default).
+    """
+    lock_file = None
+    locked = True
+    if CROSS_PROCESS_LOCK and fcntl is not None:
+        digest = hashlib.sha1(repo_name.encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(CACHE_DIR, f".heatmap-lock-{digest}")
+        deadline = time.monotonic() + (REPO_LOCK_TIMEOUT if timeout is None else timeout)
+        try:
+            lock_file = acquire_lock_file(path, deadline)
+            if lock_file is None:
+                print(f"Timed out waiting for the lock on {repo_name}")
+                locked = False
+        except OSError as e:
+            print(f"Warning: Could not open lock file for {repo_name}: {e}")
+
+    if lock_file is None:
+        yield locked
+        return
+
+    try:
+        yield True
+    finally:
+        # Remove the file while still holding the lock, so none are left behind
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+def coalesced_refresh(repo_name, force_refresh=False, background=False):
+    """
+    Refresh a repo through the single-flight guard and the cross-process lock.
+
+    After acquiring the lock the cache is read again: if another process (or a
+    refresh we waited on) already updated the entry, its data is reused. If the
+    lock is not acquired within REPO_LOCK_TIMEOUT, the cached entry is served
+    as is, or TimeoutError is raised when there is none.
+    """
+    def version(entry):
+        return entry.get("timestamp"), entry.get("updated")
+
+    def run():
+        before = repo_cache.get(repo_name) or {}
+        with repo_file_lock(repo_name) as locked:
+            cached = repo_cache.get(repo_name) or {}
+            if not locked:
+                if cached:
+                    return cached["data"]
+                raise TimeoutError(f"Another worker is still fetching {repo_name}")
+            if cached and version(cached) != version(before):
+                return cached["data"]
+            if cached and not force_refresh and not repo_needs_refresh(cached, time.time()):
+                return cached["data"]
+            if background and not cached:
+                return []
+            return refresh_contributors(repo_name, cached, force_refresh=force_refresh)
+
+    return single_flight(repo_name, run)
+
+refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS)
+refresh_futures = {}
+refresh_lock = threading.Lock()
+
+def run_background_refresh(repo_name):
+    """Background job: refresh a repo unless another worker already did."""
+    try:
+        coalesced_refresh(repo_name, background=True)
+    except Exception as e:
+        print(f"Error refreshing {repo_name}: {e}")
+
+def schedule_refresh(repo_name):
+    """Queue a background refresh for a repo, merging duplicate requests into one."""
+    with refresh_lock:
+        future = refresh_futures.get(repo_name)
+        if future is not None and not future.done():
+            return future
+        future = refresh_executor.submit(run_background_refresh, repo_name)
+        refresh_futures[repo_name] = future
+
+    def forget(done):
+        with refresh_lock:
+            if refresh_futures.get(repo_name) is done:
+                del refresh_futures[repo_name]
+
+    future.add_done_callback(forget)
+    return future
+
+def get_all_contributors(repo_name, force_refresh=False, allow_stale=False):
+    """
+    Return a repo's contributors with their locations, fetching from GitHub as needed.
+
+    With allow_stale, an expired entry is returned immediately and refreshed in
+    the background; only repos never seen before are fetched inline.
+    """
+    cached = repo_cache.get(repo_name) or {}
+    if not force_refresh and cached:
+        if not repo_needs_refresh(cached, time.time()):
+            count_cache("repo", "hit")
+            return cached["data"]
+        if allow_stale and BACKGROUND_REFRESH:
+            count_cache("repo", "stale")
+            schedule_refresh(repo_name)
+            return cached["data"]
+
+    count_cache("repo", "miss")
+    # Concurrent requests for the same repo share a single crawl
+    with timed("refresh"):
+        return coalesced_refresh(repo_name, force_refresh=force_refresh)
+
+def aggregate_country_counts(contributors):
+    """Count contributors per resolved country code."""
+    country_counts = {}
+    for user in contributors:
+        code = get_user_country(user)
+        if code:
+            country_counts[code] = country_counts.get(code, 0) + 1
+    return country_counts
+
+def build_snapshot(repo_name, entry, contributors):
+    """Return the snapshot for a stored repo entry, aggregating and storing it if out of date."""
+    source = entry.get("updated", entry["timestamp"]) if entry else time.time()
+
+    snapshot = entry.get("snapshot") if entry else None
+    if snapshot and snapshot.get("source") == source and snapshot.get("resolver") == RESOLVER_VERSION:
+        count_cache("snapshot", "hit")
+        return snapshot
+
+    count_cache("snapshot", "miss")
+    with timed("aggregate"):
+        counts = aggregate_country_counts(contributors)
+    snapshot = {
+        "timestamp": time.time(),
+        "source": source,
+        "resolver": RESOLVER_VERSION,
+        "counts": counts,
+    }
+    current = repo_cache.get(repo_name)
+    if entry and current and current["timestamp"] == entry["timestamp"] and current.get("updated") == entry.get("updated"):
+        # Only store it if a background refresh has not replaced the entry meanwhile
+        repo_cache[repo_name] = dict(current, snapshot=snapshot)
+        repo_cache.save()
+    return snapshot
+
+def get_country_snapshot(repo_name, force_refresh=False, allow_stale=False):
+    """
+    Return the repo's country-count snapshot.
+
+    The snapshot holds the counts plus the contributor list timestamp
+    ("source") and resolver version it was built from, which together identify
+    the data version. It is rebuilt whenever the contributor list is refreshed
+    or the resolver tables change.
+    """
+    get_all_contributors(repo_name, force_refresh=force_refresh, allow_stale=allow_stale)
+    # Count from the stored entry so the snapshot matches its data version
+    entry = repo_cache.get(repo_name)
+    if not entry:
+        # Only a background refresh skips a repo it has nothing cached for
+        raise RepoUnavailable(f"No contributor data for {repo_name} yet")
+    return build_snapshot(repo_name, entry, entry["data"])
+
+def get_stored_snapshot(repo_name):
+    """Return the snapshot of a cached repo without contacting GitHub, or None if it is not cached."""
+    entry = repo_cache.get(repo_name)
+    if not entry:
+        return None
+    return build_snapshot(repo_name, entry, entry["data"])
+
+def get_country_counts(repo_name, force_refresh=False):
+    """Return {country_code: count} for a repo, served from its stored snapshot."""
+    return get_country_snapshot(repo_name, force_refresh=force_refresh)["counts"]
@@ -3,53 +3,62 @@ Embeddable Heatmap Widget
 This module contains the production widget endpoint.
 """
 from flask import Blueprint, request, Response
+import io
 import os
-import math
+import json
+import hmac
+import time
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
 from lxml import etree
-from utils import get_all_contributors, resolve_country_code
+
+try:
+    import brotli
+except ImportError:  # Listed in requirements.txt; without it only gzip is served
+    brotli = None
+
+from utils import (get_country_snapshot, single_flight, timed, record_stage, count_cache,
+                   start_request_timings, get_request_timings, format_metrics,
+                   load_artifact, code_fingerprint, ARTIFACT_VERSION, RepoUnavailable)
 from data import COUNTRY_NAMES
+from palette import SCALES, DEFAULT_SCALE, count_color, get_palette, parse_stops
 
 widget_bp = Blueprint('widget', __name__)
 
+# Rendered images kept in memory, keyed by (repo, variant, theme, palette, data version),
+# bounded by their total size in bytes (including the compressed copies)
+RENDER_CACHE_BYTES = int(os.getenv("RENDER_CACHE_BYTES", 32 * 1024 * 1024))
+# Separate budget for renders with custom color stops or raster widths, so arbitrary
+# query strings cannot push the default renders out
+CUSTOM_RENDER_CACHE_BYTES = int(os.getenv("CUSTOM_RENDER_CACHE_BYTES", 4 * 1024 * 1024))
+# Browser/CDN caching for the widget response
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", 3600))
+CACHE_STALE_WHILE_REVALIDATE = int(os.getenv("CACHE_STALE_WHILE_REVALIDATE", 86400))
+
+# profile=1 on /api/heatmap is only honored with this token; PROFILE_DIR also keeps the reports
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+PROFILE_TOP = 30
+
+# Compression levels; each render is compressed at most once per encoding
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# Raster output formats and the accepted width range in pixels
+RASTER_FORMATS = {'png': 'image/png', 'webp': 'image/webp'}
+MIN_RASTER_WIDTH = 200
+MAX_RASTER_WIDTH = 2400
+
 def get_color(count, max_count):
     """Returns an interpolated blue shade from light to dark blue."""
-    if count == 0:
-        return "#ffffff"
-    
-    if max_count > 1:
-        intensity = math.log(count) / math.log(max_count) if count > 1 else 0
-    else:
-        intensity = 0
-    
-    start_r, start_g, start_b = 147, 197, 253
-    end_r, end_g, end_b = 30, 64, 175
-    
-    r = int(start_r + (end_r - start_r) * intensity)
-    g = int(start_g + (end_g - start_g) * intensity)
-    b = int(start_b + (end_b - start_b) * intensity)
-    
-    return f"#{r:02x}{g:02x}{b:02x}"
+    return count_color('light', count, max_count)
 
 
 def get_color_dark(count, max_count):
     """Returns an interpolated blue shade for dark mode (Nice Dark)."""
-    if count == 0:
-        return "#1e293b"
-    
-    if max_count > 1:
-        intensity = math.log(count) / math.log(max_count) if count > 1 else 0
-    else:
-        intensity = 0
-    
-    # Using GitHub-inspired dark blue shades
-    start_r, start_g, start_b = 31, 111, 235 # #1f6feb
-    end_r, end_g, end_b = 88, 166, 255   # #58a6ff
-    
-    r = int(start_r + (end_r - start_r) * intensity)
-    g = int(start_g + (end_g - start_g) * intensity)
-    b = int(start_b + (end_b - start_b) * intensity)
-    
-    return f"#{r:02x}{g:02x}{b:02x}"
+    return count_color('dark', count, max_count)
 
 
 def get_country_name(code):
@@ -58,14 +67,41 @@ def get_country_name(code):
     return COUNTRY_NAMES.get(code_upper, code_upper)
 
 
+MAP_SVG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'sirlisko-world-map.svg')
+
+
 def load_map_svg():
     """Load and parse the SirLisko map SVG."""
-    svg_path = os.path.join(os.path.dirname(__file__), 'static', 'sirlisko-world-map.svg')
     parser = etree.XMLParser(remove_blank_text=True)
-    orig_tree = etree.parse(svg_path, parser)
+    orig_tree = etree.parse(MAP_SVG_PATH, parser)
     return orig_tree.getroot()
 
 
+SHAPE_TAGS = ('path', 'polygon', 'circle', 'rect')
+# Placeholder fill value marking where colors go in the serialized map template
+FILL_MARK = "__heatmap_fill__"
+
+_map_template = None
+_raster_libs = None
+
+
+def get_shape_code(node):
+    """Extract the two-letter country code from a map shape's id or data-id."""
+    node_id = node.get('id', '').lower()
+    if not node_id:
+        node_id = node.get('data-id', '').lower()
+    
+    clean_id = node_id.lstrip('_')
+    
+    if len(clean_id) == 2:
+        return clean_id
+    if len(clean_id) > 2:
+        for p in clean_id.split():
+            if len(p) == 2:
+                return p
+    return None
+
+
 def clone_elements(source, target, is_outline, country_counts, max_count, color_fn=get_color, empty_fill='#ffffff'):
     """Clone SVG elements with heatmap coloring."""
     if not isinstance(source.tag, str): return
@@ -80,25 +116,12 @@ def clone_elements(source, target, is_outline, country_counts, max_count, color_
     if 'transform' in source.attrib:
         new_node.set('transform', source.attrib['transform'])
         
-    node_id = source.get('id', '').lower()
-    if not node_id:
-        node_id = source.get('data-id', '').lower()
-    
-    clean_id = node_id.lstrip('_')
-    
-    if tag in ['path', 'polygon', 'circle', 'rect']:
+    if tag in SHAPE_TAGS:
         if is_outline:
             new_node.set('class', 'country-outline')
         else:
             new_node.set('class', 'country-fill')
-            found_code = None
-            if len(clean_id) == 2: found_code = clean_id
-            elif len(clean_id) > 2:
-                parts = clean_id.split()
-                for p in parts:
-                    if len(p) == 2:
-                        found_code = p
-                        break
+            found_code = get_shape_code(source)
             
             if found_code:
                 count = country_counts.get(found_code, 0)
@@ -110,283 +133,298 @@ def clone_elements(source, target, is_outline, country_counts, max_count, color_
         clone_elements(child, new_node, is_outline, country_counts, max_count, color_fn, empty_fill)
 
 
-def render_map_only(country_counts, theme='light'):
-    """Render map-only variant (compact)."""
-    max_count = max(country_counts.values()) if country_counts else 1
-    total_countries = len(country_counts)
-    is_dark = theme == 'dark'
+def map_template_fingerprint():
+    """Identify the map SVG and builder code a template artifact was built from."""
+    code = code_fingerprint(build_map_template, clone_elements, get_shape_code, load_map_svg)
+    if code is None:
+        return None
+    digest = hashlib.sha1(repr((SHAPE_TAGS, FILL_MARK)).encode())
+    with open(MAP_SVG_PATH, 'rb') as f:
+        digest.update(f.read())
+    return f"{ARTIFACT_VERSION}:{digest.hexdigest()}:{code}"
 
-    card_w = 920
-    card_h = 620
-    
-    final_svg = etree.Element("svg", 
-        width=str(card_w), 
-        height=str(card_h), 
-        viewBox=f"0 0 {card_w} {card_h}",
-        version="1.1",
-        xmlns="http://www.w3.org/2000/svg"
-    )
-    
-    if is_dark:
-        style_elem = etree.SubElement(final_svg, "style")
-        style_elem.text = """
-            @import url('https://rsms.me/inter/inter.css');
-            .card { fill: #0f172a; rx: 10; }
-            .title { font-family: 'Inter', sans-serif; font-size: 22px; font-weight: 600; fill: #f8fafc; }
-            .badge-bg { fill: #3b82f6; }
-            .badge-text { font-family: 'Inter', sans-serif; font-size: 10px; font-weight: 600; fill: #ffffff; letter-spacing: 0.05em; text-anchor: middle; dominant-baseline: middle; }
-            .badge-text-mobile { font-family: 'Inter', sans-serif; font-size: 16px; font-weight: 600; fill: #ffffff; letter-spacing: 0.05em; text-anchor: middle; dominant-baseline: middle; }
-            .divider { stroke: #334155; stroke-width: 1; }
-            .country-fill { stroke: none; }
-            .country-outline { fill: none; stroke: #334155; stroke-width: 0.5; stroke-linejoin: round; pointer-events: none; }
-            .badge-desktop { display: block; }
-            .badge-mobile { display: none; }
-            
-            @media (max-width: 600px) {
-                .title { font-size: 32px; }
-                .badge-desktop { display: none; }
-                .badge-mobile { display: block; }
-            }
-        """
-    else:
-        style_elem = etree.SubElement(final_svg, "style")
-        style_elem.text = """
-            @import url('https://rsms.me/inter/inter.css');
-            .card { fill: #f1f5f9; rx: 10; }
-            .title { font-family: 'Inter', sans-serif; font-size: 22px; font-weight: 600; fill: #0f172a; }
-            .badge-bg { fill: #bfdbfe; }
-            .badge-text { font-family: 'Inter', sans-serif; font-size: 10px; font-weight: 600; fill: #1e40af; letter-spacing: 0.05em; text-anchor: middle; dominant-baseline: middle; }
-            .badge-text-mobile { font-family: 'Inter', sans-serif; font-size: 16px; font-weight: 600; fill: #1e40af; letter-spacing: 0.05em; text-anchor: middle; dominant-baseline: middle; }
-            .divider { stroke: #cbd5e1; stroke-width: 1; }
-            .country-fill { stroke: none; }
-            .country-outline { fill: none; stroke: #334155; stroke-width: 0.4; stroke-linejoin: round; pointer-events: none; opacity: 0.8; }
-            .badge-desktop { display: block; }
-            .badge-mobile { display: none; }
-            
-            @media (max-width: 600px) {
-                .title { font-size: 32px; }
-                .badge-desktop { display: none; }
-                .badge-mobile { display: block; }
-            }
-        """
-
-    etree.SubElement(final_svg, "rect", x="0", y="0", width=str(card_w), height=str(card_h), rx="10", attrib={"class": "card"})
-    etree.SubElement(final_svg, "text", x="40", y="60", attrib={"class": "title"}).text = "Contributors heatmap"
-    
-    # Singular/plural logic for badge text
-    badge_val = f"{total_countries} COUNTRY" if total_countries == 1 else f"{total_countries} COUNTRIES"
-    
-    # Desktop badge (normal size)
-    text_length = len(badge_val)
-    badge_w_desktop = max(120, text_length * 8.5)
-    badge_h_desktop = 22
-    badge_x_desktop = card_w - badge_w_desktop - 40
-    badge_y_desktop = 43
-    
-    desktop_group = etree.SubElement(final_svg, "g", attrib={"class": "badge-desktop"})
-    etree.SubElement(desktop_group, "rect", x=str(badge_x_desktop), y=str(badge_y_desktop), 
-                     width=str(badge_w_desktop), height=str(badge_h_desktop), 
-                     rx=str(badge_h_desktop/2), attrib={"class": "badge-bg"})
-    etree.SubElement(desktop_group, "text", x=str(badge_x_desktop + badge_w_desktop/2), 
-                     y=str(badge_y_desktop + badge_h_desktop/2 + 1), 
-                     attrib={"class": "badge-text"}).text = badge_val
-    
-    # Mobile badge (larger size)
-    badge_w_mobile = max(180, text_length * 13)  # Larger for mobile
-    badge_h_mobile = 36  # Taller for mobile
-    badge_x_mobile = card_w - badge_w_mobile - 40
-    badge_y_mobile = 36
-    
-    mobile_group = etree.SubElement(final_svg, "g", attrib={"class": "badge-mobile"})
-    etree.SubElement(mobile_group, "rect", x=str(badge_x_mobile), y=str(badge_y_mobile), 
-                     width=str(badge_w_mobile), height=str(badge_h_mobile), 
-                     rx=str(badge_h_mobile/2), attrib={"class": "badge-bg"})
-    etree.SubElement(mobile_group, "text", x=str(badge_x_mobile + badge_w_mobile/2), 
-                     y=str(badge_y_mobile + badge_h_mobile/2 + 1), 
-                     attrib={"class": "badge-text-mobile"}).text = badge_val
-    
-    etree.SubElement(final_svg, "line", x1="40", y1="90", x2=str(card_w-40), y2="90", attrib={"class": "divider"})
 
+def build_map_template():
+    """
+    Build the precompiled map template.
+
+    The source SVG is parsed and cloned a single time into a fill layer and an
+    outline layer, which are then serialized. The fill layer is split around
+    each shape's fill value, so a render only interleaves colors with the
+    ``fill_segments`` (one color per entry of ``fill_codes``, document order).
+    """
     orig_root = load_map_svg()
     vb_str = orig_root.get("viewBox")
     if not vb_str and 'width' in orig_root.attrib and 'height' in orig_root.attrib:
          vb_str = f"0 0 {orig_root.attrib['width']} {orig_root.attrib['height']}"
     if vb_str:
         vb = vb_str.replace(',', ' ').split()
-        ox, oy, ow, oh = float(vb[0]), float(vb[1]), float(vb[2]), float(vb[3])
+        viewbox = (float(vb[0]), float(vb[1]), float(vb[2]), float(vb[3]))
     else:
-        ox, oy, ow, oh = 0, 0, 1000, 500
-
-    target_w = card_w - 80
-    target_h = card_h - 150
+        viewbox = (0, 0, 1000, 500)
+
+    fills = etree.Element("g")
+    outlines = etree.Element("g")
+    for child in orig_root:
+        clone_elements(child, fills, False, {}, 1)
+        clone_elements(child, outlines, True, {}, 1)
+
+    fill_codes = [get_shape_code(node) for node in fills.iter(*SHAPE_TAGS)]
+    for node in fills.iter(*SHAPE_TAGS):
+        node.set('fill', FILL_MARK)
+    fill_bytes = b"".join(etree.tostring(child) for child in fills)
+    fill_segments = fill_bytes.split(FILL_MARK.encode())
+    assert len(fill_segments) == len(fill_codes) + 1
+
+    return {
+        "viewbox": viewbox,
+        "fill_codes": fill_codes,
+        "fill_segments": fill_segments,
+        "outline_bytes": b"".join(etree.tostring(child) for child in outlines),
+    }
+
+
+def get_map_template():
+    """Load the map template once per process from its prebuilt artifact, building it if needed."""
+    global _map_template
+    if _map_template is None:
+        template = load_artifact("map_template", map_template_fingerprint())
+        _map_template = template if template is not None else build_map_template()
+    return _map_template
+
+
+def iter_map_layers(x, y, target_w, target_h, country_counts, colors):
+    """Yield the colored fill layer and the outline layer as bytes, fitted into the target box."""
+    template = get_map_template()
+    ox, oy, ow, oh = template["viewbox"]
     scale = min(target_w / ow, target_h / oh)
-    tx = 40 + (target_w - ow * scale) / 2 - ox * scale
-    ty = 130 + (target_h - oh * scale) / 2 - oy * scale
-
-    color_fn = get_color_dark if is_dark else get_color
-    empty_fill = '#1e293b' if is_dark else '#ffffff'
-    
-    fills_container = etree.SubElement(final_svg, "g", transform=f"translate({tx}, {ty}) scale({scale})")
-    for child in orig_root: 
-        clone_elements(child, fills_container, False, country_counts, max_count, color_fn, empty_fill)
-    
-    outlines_container = etree.SubElement(final_svg, "g", transform=f"translate({tx}, {ty}) scale({scale})")
-    for child in orig_root: 
-        clone_elements(child, outlines_container, True, country_counts, max_count, color_fn, empty_fill)
-
-    return etree.tostring(final_svg, pretty_print=True, xml_declaration=True, encoding="utf-8")
+    tx = x + (target_w - ow * scale) / 2 - ox * scale
+    ty = y + (target_h - oh * scale) / 2 - oy * scale
+    group_open = f'<g transform="translate({tx}, {ty}) scale({scale})">'.encode()
+
+    # colors is the palette table: count -> fill, index 0 being the empty fill
+    fills = {None: colors[0].encode()}
+    segments = template["fill_segments"]
+    parts = [group_open, segments[0]]
+    for code, segment in zip(template["fill_codes"], segments[1:]):
+        fill = fills.get(code)
+        if fill is None:
+            fill = fills[code] = colors[country_counts.get(code, 0)].encode()
+        parts.append(fill)
+        parts.append(segment)
+    parts.append(b"</g>")
+    yield b"".join(parts)
+
+    yield group_open + template["outline_bytes"] + b"</g>"
+
+
+# Per-theme colors for the card chrome; everything else in the CSS is shared
+THEME_STYLES = {
+    'light': {
+        "card": "#f1f5f9",
+        "title": "#0f172a",
+        "badge_bg": "#bfdbfe",
+        "badge_text": "#1e40af",
+        "divider": "#cbd5e1",
+        "outline": "stroke-width: 0.4; stroke-linejoin: round; pointer-events: none; opacity: 0.8;",
+        "list_title": "#64748b",
+        "country_name": "#334155",
+        "country_count": "#1e40af",
+    },
+    'dark': {
+        "card": "#0f172a",
+        "title": "#f8fafc",
+        "badge_bg": "#3b82f6",
+        "badge_text": "#ffffff",
+        "divider": "#334155",
+        "outline": "stroke-width: 0.5; stroke-linejoin: round; pointer-events: none;",
+        "list_title": "#94a3b8",
+        "country_name": "#f8fafc",
+        "country_count": "#60a5fa",
+    },
+}
+
+# Card size and font sizes per variant
+CARD_LAYOUTS = {
+    'map': {"width": 920, "height": 620, "title": 22, "title_mobile": 32, "badge": 10, "badge_mobile": 16},
+    'list': {"width": 1200, "height": 620, "title": 28, "title_mobile": 40, "badge": 13, "badge_mobile": 20},
+}
+# Width of the map column in the list variant
+LIST_MAP_AREA_W = 800
+
+_card_chrome = {}
+
+
+def build_card_css(variant, theme):
+    """Build the <style> text for a variant/theme from the shared rules."""
+    c = THEME_STYLES[theme]
+    size = CARD_LAYOUTS[variant]
+    badge_text = (f"font-weight: 600; fill: {c['badge_text']}; letter-spacing: 0.05em; "
+                  f"text-anchor: middle; dominant-baseline: middle;")
+    rules = [
+        "@import url('https://rsms.me/inter/inter.css');",
+        f".card {{ fill: {c['card']}; rx: 10; }}",
+        f".title {{ font-family: 'Inter', sans-serif; font-size: {size['title']}px; font-weight: 600; fill: {c['title']}; }}",
+        f".badge-bg {{ fill: {c['badge_bg']}; }}",
+        f".badge-text {{ font-family: 'Inter', sans-serif; font-size: {size['badge']}px; {badge_text} }}",
+        f".badge-text-mobile {{ font-family: 'Inter', sans-serif; font-size: {size['badge_mobile']}px; {badge_text} }}",
+        f".divider {{ stroke: {c['divider']}; stroke-width: 1; }}",
+        ".country-fill { stroke: none; }",
+        f".country-outline {{ fill: none; stroke: #334155; {c['outline']} }}",
+    ]
+    if variant == 'list':
+        rules += [
+            f".list-title {{ font-family: 'Inter', sans-serif; font-size: 18px; font-weight: 600; fill: {c['list_title']}; }}",
+            f".country-name {{ font-family: 'Inter', sans-serif; font-size: 16px; font-weight: 500; fill: {c['country_name']}; }}",
+            f".country-count {{ font-family: 'Inter', sans-serif; font-size: 16px; font-weight: 700; fill: {c['country_count']}; }}",
+            f".list-divider {{ stroke: {c['divider']}; stroke-width: 1; }}",
+        ]
+    rules += [
+        ".badge-desktop { display: block; }",
+        ".badge-mobile { display: none; }",
+        "@media (max-width: 600px) {",
+        f".title {{ font-size: {size['title_mobile']}px; }}",
+        ".badge-desktop { display: none; }",
+        ".badge-mobile { display: block; }",
+    ]
+    if variant == 'list':
+        rules += [
+            ".list-title { font-size: 24px; }",
+            ".country-name, .country-count { font-size: 24px; }",
+        ]
+    rules.append("}")
+    return " ".join(rules)
+
+
+def get_card_chrome(variant, theme):
+    """
+    Return the static parts of a card as pre-serialized bytes, built once per (variant, theme).
 
+    ``head`` is everything up to the badges (XML declaration, <svg> open tag,
+    <style>, card background and title), ``dividers`` the header lines that
+    follow the badges and, for the list variant, ``list_head`` the list title
+    and its divider. Only the badges, map fills and country rows are rendered
+    per request.
+    """
+    key = (variant, theme)
+    chrome = _card_chrome.get(key)
+    if chrome is not None:
+        return chrome
 
-def render_map_with_list(country_counts, theme='light'):
-    """Render map with country list variant."""
-    max_count = max(country_counts.values()) if country_counts else 1
-    total_countries = len(country_counts)
-    total_contributors = sum(country_counts.values())
-    is_dark = theme == 'dark'
+    layout = CARD_LAYOUTS[variant]
+    card_w, card_h = layout["width"], layout["height"]
 
-    card_w = 1200
-    card_h = 620
-    map_area_w = 800
-    list_area_x = map_area_w + 30
-    
-    final_svg = etree.Element("svg", 
-        width=str(card_w), 
-        height=str(card_h), 
+    svg = etree.Element("svg",
+        width=str(card_w),
+        height=str(card_h),
         viewBox=f"0 0 {card_w} {card_h}",
         version="1.1",
         xmlns="http://www.w3.org/2000/svg"
     )
-    
-    if is_dark:
-        style_elem = etree.SubElement(final_svg, "style")
-        style_elem.text = """
-            @import url('https://rsms.me/inter/inter.css');
-            .card { fill: #0f172a; rx: 10; }
-            .title { font-family: 'Inter', sans-serif; font-size: 28px; font-weight: 600; fill: #f8fafc; }
-            .badge-bg { fill: #3b82f6; }
-            .badge-text { font-family: 'Inter', sans-serif; font-size: 13px; font-weight: 600; fill: #ffffff; letter-spacing: 0.05em; text-anchor: middle; dominant-baseline: middle; }
-            .badge-text-mobile { font-family: 'Inter', sans-serif; font-size: 20px; font-weight: 600; fill: #ffffff; letter-spacing: 0.05em; text-anchor: middle; dominant-baseline: middle; }
-            .divider { stroke: #334155; stroke-width: 1; }
-            .country-fill { stroke: none; }
-            .country-outline { fill: none; stroke: #334155; stroke-width: 0.5; stroke-linejoin: round; pointer-events: none; }
-            .list-title { font-family: 'Inter', sans-serif; font-size: 18px; font-weight: 600; fill: #94a3b8; }
-            .country-name { font-family: 'Inter', sans-serif; font-size: 16px; font-weight: 500; fill: #f8fafc; }
-            .country-count { font-family: 'Inter', sans-serif; font-size: 16px; font-weight: 700; fill: #60a5fa; }
-            .list-divider { stroke: #334155; stroke-width: 1; }
-            .badge-desktop { display: block; }
-            .badge-mobile { display: none; }
-            
-            @media (max-width: 600px) {
-                .title { font-size: 40px; }
-                .badge-desktop { display: none; }
-                .badge-mobile { display: block; }
-                .list-title { font-size: 24px; }
-                .country-name, .country-count { font-size: 24px; }
-            }
-        """
+    style_elem = etree.Element("style")
+    style_elem.text = build_card_css(variant, theme)
+    card = etree.Element("rect", x="0", y="0", width=str(card_w), height=str(card_h), rx="10", attrib={"class": "card"})
+    title = etree.Element("text", x="40", y="60", attrib={"class": "title"})
+    title.text = "Contributors heatmap"
+
+    head = [b"<?xml version='1.0' encoding='utf-8'?>\n", etree.tostring(svg)[:-2] + b">"]
+    head += [etree.tostring(el) for el in (style_elem, card, title)]
+
+    if variant == 'list':
+        list_area_x = LIST_MAP_AREA_W + 30
+        dividers = [
+            etree.Element("line", x1="40", y1="90", x2=str(LIST_MAP_AREA_W), y2="90", attrib={"class": "divider"}),
+            # Vertical divider between map and list
+            etree.Element("line", x1=str(LIST_MAP_AREA_W + 20), y1="40", x2=str(LIST_MAP_AREA_W + 20), y2=str(card_h - 40), attrib={"class": "list-divider"}),
+        ]
+        # Fixed label "TOP COUNTRIES" (no count)
+        list_title = etree.Element("text", x=str(list_area_x + 15), y="60", attrib={"class": "list-title"})
+        list_title.text = "TOP COUNTRIES"
+        list_head = [list_title, etree.Element("line", x1=str(list_area_x), y1="90", x2=str(card_w - 40), y2="90", attrib={"class": "divider"})]
     else:
-        style_elem = etree.SubElement(final_svg, "style")
-        style_elem.text = """
-            @import url('https://rsms.me/inter/inter.css');
-            .card { fill: #f1f5f9; rx: 10; }
-            .title { font-family: 'Inter', sans-serif; font-size: 28px; font-weight: 600; fill: #0f172a; }
-            .badge-bg { fill: #bfdbfe; }
-            .badge-text { font-family: 'Inter', sans-serif; font-size: 13px; font-weight: 600; fill: #1e40af; letter-spacing: 0.05em; text-anchor: middle; dominant-baseline: middle; }
-            .badge-text-mobile { font-family: 'Inter', sans-serif; font-size: 20px; font-weight: 600; fill: #1e40af; letter-spacing: 0.05em; text-anchor: middle; dominant-baseline: middle; }
-            .divider { stroke: #cbd5e1; stroke-width: 1; }
-            .country-fill { stroke: none; }
-            .country-outline { fill: none; stroke: #334155; stroke-width: 0.4; stroke-linejoin: round; pointer-events: none; opacity: 0.8; }
-            .list-title { font-family: 'Inter', sans-serif; font-size: 18px; font-weight: 600; fill: #64748b; }
-            .country-name { font-family: 'Inter', sans-serif; font-size: 16px; font-weight: 500; fill: #334155; }
-            .country-count { font-family: 'Inter', sans-serif; font-size: 16px; font-weight: 700; fill: #1e40af; }
-            .list-divider { stroke: #cbd5e1; stroke-width: 1; }
-            .badge-desktop { display: block; }
-            .badge-mobile { display: none; }
-
-            @media (max-width: 600px) {
-                .title { font-size: 40px; }
-                .badge-desktop { display: none; }
-                .badge-mobile { display: block; }
-                .list-title { font-size: 24px; }
-                .country-name, .country-count { font-size: 24px; }
-            }
-        """
-
-    etree.SubElement(final_svg, "rect", x="0", y="0", width=str(card_w), height=str(card_h), rx="10", attrib={"class": "card"})
-    
-    # Header
-    etree.SubElement(final_svg, "text", x="40", y="60", attrib={"class": "title"}).text = "Contributors heatmap"
+        dividers = [etree.Element("line", x1="40", y1="90", x2=str(card_w-40), y2="90", attrib={"class": "divider"})]
+        list_head = []
+
+    chrome = {
+        "head": b"".join(head),
+        "dividers": b"".join(etree.tostring(el) for el in dividers),
+        "list_head": b"".join(etree.tostring(el) for el in list_head),
+    }
+    _card_chrome[key] = chrome
+    return chrome
+
+
+def render_badge(badge_val, right_x, css_class, min_w, char_w, badge_h, badge_y, text_class):
+    """Serialize one count badge, right-aligned at right_x."""
+    badge_w = max(min_w, len(badge_val) * char_w)
+    badge_x = right_x - badge_w
+
+    group = etree.Element("g", attrib={"class": css_class})
+    etree.SubElement(group, "rect", x=str(badge_x), y=str(badge_y),
+                     width=str(badge_w), height=str(badge_h),
+                     rx=str(badge_h/2), attrib={"class": "badge-bg"})
+    etree.SubElement(group, "text", x=str(badge_x + badge_w/2),
+                     y=str(badge_y + badge_h/2 + 1),
+                     attrib={"class": text_class}).text = badge_val
+    return etree.tostring(group)
+
+
+def iter_map_only(country_counts, theme='light', scale=DEFAULT_SCALE, stops=None):
+    """Stream the map-only variant (compact) as byte chunks."""
+    total_countries = len(country_counts)
+    chrome = get_card_chrome('map', theme)
+
+    card_w = CARD_LAYOUTS['map']["width"]
+    card_h = CARD_LAYOUTS['map']["height"]
+
+    yield chrome["head"]
+
     # Singular/plural logic for badge text
     badge_val = f"{total_countries} COUNTRY" if total_countries == 1 else f"{total_countries} COUNTRIES"
-    
-    # Desktop badge (normal size)
-    text_length = len(badge_val)
-    badge_w_desktop = max(145, text_length * 10)
-    badge_h_desktop = 26
-    badge_x_desktop = map_area_w - badge_w_desktop
-    badge_y_desktop = 41
-    
-    desktop_group = etree.SubElement(final_svg, "g", attrib={"class": "badge-desktop"})
-    etree.SubElement(desktop_group, "rect", x=str(badge_x_desktop), y=str(badge_y_desktop), 
-                     width=str(badge_w_desktop), height=str(badge_h_desktop), 
-                     rx=str(badge_h_desktop/2), attrib={"class": "badge-bg"})
-    etree.SubElement(desktop_group, "text", x=str(badge_x_desktop + badge_w_desktop/2), 
-                     y=str(badge_y_desktop + badge_h_desktop/2 + 1), 
-                     attrib={"class": "badge-text"}).text = badge_val
-    
-    # Mobile badge (larger size)
-    badge_w_mobile = max(220, text_length * 15)  # Larger for mobile
-    badge_h_mobile = 44  # Taller for mobile
-    badge_x_mobile = map_area_w - badge_w_mobile
-    badge_y_mobile = 34
-    
-    mobile_group = etree.SubElement(final_svg, "g", attrib={"class": "badge-mobile"})
-    etree.SubElement(mobile_group, "rect", x=str(badge_x_mobile), y=str(badge_y_mobile), 
-                     width=str(badge_w_mobile), height=str(badge_h_mobile), 
-                     rx=str(badge_h_mobile/2), attrib={"class": "badge-bg"})
-    etree.SubElement(mobile_group, "text", x=str(badge_x_mobile + badge_w_mobile/2), 
-                     y=str(badge_y_mobile + badge_h_mobile/2 + 1), 
-                     attrib={"class": "badge-text-mobile"}).text = badge_val
-    
-    etree.SubElement(final_svg, "line", x1="40", y1="90", x2=str(map_area_w), y2="90", attrib={"class": "divider"})
+    # Desktop badge (normal size), then a larger one for mobile
+    yield render_badge(badge_val, card_w - 40, "badge-desktop", 120, 8.5, 22, 43, "badge-text")
+    yield render_badge(badge_val, card_w - 40, "badge-mobile", 180, 13, 36, 36, "badge-text-mobile")
 
-    # Vertical divider between map and list
-    etree.SubElement(final_svg, "line", x1=str(map_area_w + 20), y1="40", x2=str(map_area_w + 20), y2=str(card_h - 40), attrib={"class": "list-divider"})
+    yield chrome["dividers"]
 
-    # Load and render map (smaller area)
-    orig_root = load_map_svg()
-    vb_str = orig_root.get("viewBox")
-    if not vb_str and 'width' in orig_root.attrib and 'height' in orig_root.attrib:
-         vb_str = f"0 0 {orig_root.attrib['width']} {orig_root.attrib['height']}"
-    if vb_str:
-        vb = vb_str.replace(',', ' ').split()
-        ox, oy, ow, oh = float(vb[0]), float(vb[1]), float(vb[2]), float(vb[3])
-    else:
-        ox, oy, ow, oh = 0, 0, 1000, 500
+    colors = get_palette(theme, country_counts, scale, stops)
+    yield from iter_map_layers(40, 130, card_w - 80, card_h - 150, country_counts, colors)
+    yield b"</svg>"
 
-    target_w = map_area_w - 80
-    target_h = card_h - 150
-    scale = min(target_w / ow, target_h / oh)
-    tx = 40 + (target_w - ow * scale) / 2 - ox * scale
-    ty = 130 + (target_h - oh * scale) / 2 - oy * scale
 
-    color_fn = get_color_dark if is_dark else get_color
-    empty_fill = '#1e293b' if is_dark else '#ffffff'
-    
-    fills_container = etree.SubElement(final_svg, "g", transform=f"translate({tx}, {ty}) scale({scale})")
-    for child in orig_root: 
-        clone_elements(child, fills_container, False, country_counts, max_count, color_fn, empty_fill)
-    
-    outlines_container = etree.SubElement(final_svg, "g", transform=f"translate({tx}, {ty}) scale({scale})")
-    for child in orig_root: 
-        clone_elements(child, outlines_container, True, country_counts, max_count, color_fn, empty_fill)
+def render_map_only(country_counts, theme='light', scale=DEFAULT_SCALE, stops=None):
+    """Render map-only variant (compact)."""
+    return b"".join(iter_map_only(country_counts, theme, scale, stops))
+
+
+def iter_map_with_list(country_counts, theme='light', scale=DEFAULT_SCALE, stops=None):
+    """Stream the map with country list variant as byte chunks."""
+    max_count = max(country_counts.values()) if country_counts else 1
+    total_countries = len(country_counts)
+    chrome = get_card_chrome('list', theme)
+
+    card_w = CARD_LAYOUTS['list']["width"]
+    card_h = CARD_LAYOUTS['list']["height"]
+    map_area_w = LIST_MAP_AREA_W
+    list_area_x = map_area_w + 30
+
+    yield chrome["head"]
+
+    # Singular/plural logic for badge text
+    badge_val = f"{total_countries} COUNTRY" if total_countries == 1 else f"{total_countries} COUNTRIES"
+    # Desktop badge (normal size), then a larger one for mobile
+    yield render_badge(badge_val, map_area_w, "badge-desktop", 145, 10, 26, 41, "badge-text")
+    yield render_badge(badge_val, map_area_w, "badge-mobile", 220, 15, 44, 34, "badge-text-mobile")
+
+    yield chrome["dividers"]
+
+    # Render map (smaller area)
+    colors = get_palette(theme, country_counts, scale, stops)
+    yield from iter_map_layers(40, 130, map_area_w - 80, card_h - 150, country_counts, colors)
+
+    yield chrome["list_head"]
 
     list_x = list_area_x + 15
-    list_w = card_w - list_x - 40
-    
-    # Fixed label "TOP COUNTRIES" (no count)
-    etree.SubElement(final_svg, "text", x=str(list_x), y="60", attrib={"class": "list-title"}).text = "TOP COUNTRIES"
-    etree.SubElement(final_svg, "line", x1=str(list_area_x), y1="90", x2=str(card_w - 40), y2="90", attrib={"class": "divider"})
 
     # Sort countries by count (descending) and take top 10
     sorted_countries = sorted(country_counts.items(), key=lambda x: x[1], reverse=True)
@@ -405,6 +443,7 @@ def render_map_with_list(country_counts, theme='light'):
         row_spacing = 60
     
     bar_max_width = 80
+    rows = etree.Element("g")
     
     for i, (code, count) in enumerate(sorted_countries[:max_display]):
         y = list_start_y + i * row_spacing + row_spacing * 0.5  # Center text in each row space
@@ -413,30 +452,214 @@ def render_map_with_list(country_counts, theme='light'):
         # No truncation - show full country names
         
         # Country name
-        etree.SubElement(final_svg, "text", x=str(list_x), y=str(y + 4), attrib={"class": "country-name"}).text = country_name
+        etree.SubElement(rows, "text", x=str(list_x), y=str(y + 4), attrib={"class": "country-name"}).text = country_name
         
         # Count number (far right)
         count_x = card_w - 40
-        etree.SubElement(final_svg, "text", 
+        etree.SubElement(rows, "text", 
             x=str(count_x), y=str(y + 4), 
             attrib={"class": "country-count", "text-anchor": "end"}).text = str(count)
         
         bar_width = (count / max_count) * bar_max_width
         bar_x = count_x - 28 - bar_width
-        etree.SubElement(final_svg, "rect", 
+        etree.SubElement(rows, "rect", 
             x=str(bar_x), y=str(y - 12), 
             width=str(bar_width), height="18",
             rx="4",
-            fill=color_fn(count, max_count),
+            fill=colors[count],
             attrib={"class": "country-bar"})
 
     # Show remaining count if more than 10
     if len(sorted_countries) > max_display:
         remaining = len(sorted_countries) - max_display
         y = list_start_y + max_display * row_spacing + row_spacing * 0.5
-        etree.SubElement(final_svg, "text", x=str(list_x), y=str(y + 4), attrib={"class": "list-title"}).text = f"+{remaining} more countries"
+        etree.SubElement(rows, "text", x=str(list_x), y=str(y + 4), attrib={"class": "list-title"}).text = f"+{remaining} more countries"
+
+    for row in rows:
+        yield etree.tostring(row)
+    yield b"</svg>"
+
+
+def render_map_with_list(country_counts, theme='light', scale=DEFAULT_SCALE, stops=None):
+    """Render map with country list variant."""
+    return b"".join(iter_map_with_list(country_counts, theme, scale, stops))
+
+
+class RenderCache:
+    """
+    LRU of rendered images bounded by their total size in bytes.
 
-    return etree.tostring(final_svg, pretty_print=True, xml_declaration=True, encoding="utf-8")
+    Compressed copies count towards the entry holding them. An entry larger
+    than the whole budget is still returned to the caller, just not kept.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return a cached entry and mark it as recently used."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def store(self, key, body, last_modified):
+        """Cache rendered bytes with their ETag, evicting the least recently used entries."""
+        entry = {
+            "key": key,
+            "cache": self,
+            "body": body,
+            "etag": hashlib.sha1(body).hexdigest(),
+            "last_modified": last_modified,
+            "encoded": {},
+            "size": len(body),
+        }
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old["size"]
+            self.entries[key] = entry
+            self.size += entry["size"]
+            self.evict()
+        return entry
+
+    def add_encoded(self, entry, encoding, body):
+        """Attach a compressed copy to entry, counting it while the entry is cached."""
+        with self.lock:
+            if encoding in entry["encoded"]:
+                # Another request compressed it first
+                return entry["encoded"][encoding]
+            entry["encoded"][encoding] = body
+            entry["size"] += len(body)
+            if self.entries.get(entry["key"]) is entry:
+                self.size += len(body)
+                self.evict()
+        return body
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits its budget (lock held)."""
+        while self.size > self.max_bytes and self.entries:
+            _, old = self.entries.popitem(last=False)
+            self.size -= old["size"]
+
+
+render_cache = RenderCache(RENDER_CACHE_BYTES)
+custom_render_cache = RenderCache(CUSTOM_RENDER_CACHE_BYTES)
+
+
+def get_cached_render(key, custom=False):
+    """Return a cached render entry, from the custom-palette cache if custom."""
+    return (custom_render_cache if custom else render_cache).get(key)
+
+
+def store_render(key, body, last_modified, custom=False):
+    """Cache rendered bytes, in the custom-palette cache if custom, and return the entry."""
+    return (custom_render_cache if custom else render_cache).store(key, body, last_modified)
+
+
+def get_encodings():
+    """Content encodings we can serve, in order of preference."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def get_encoded_body(entry, encoding):
+    """Return the entry's body compressed with encoding, compressing it only the first time."""
+    body = entry["encoded"].get(encoding)
+    count_cache("compressed", "hit" if body is not None else "miss")
+    if body is None:
+        with timed("compress"):
+            if encoding == 'br':
+                body = brotli.compress(entry["body"], quality=BROTLI_QUALITY)
+            else:
+                body = gzip.compress(entry["body"], compresslevel=GZIP_LEVEL, mtime=0)
+        body = entry["cache"].add_encoded(entry, encoding, body)
+    return body
+
+
+def load_raster_libs():
+    """
+    Import cairosvg and Pillow on first use (cairosvg alone takes ~250ms).
+
+    Returns (cairosvg, Image), with None for a library that is not installed.
+    """
+    global _raster_libs
+    if _raster_libs is None:
+        try:
+            import cairosvg
+        except (ImportError, OSError):  # Raster output is optional; cairosvg also needs the cairo library
+            cairosvg = None
+        try:
+            from PIL import Image
+        except ImportError:  # Pillow is only needed for WebP
+            Image = None
+        _raster_libs = (cairosvg, Image)
+    return _raster_libs
+
+
+def get_raster_formats():
+    """Raster formats the installed libraries can produce."""
+    cairosvg, Image = load_raster_libs()
+    if cairosvg is None:
+        return ()
+    return ('png', 'webp') if Image is not None else ('png',)
+
+
+def offline_url_fetcher(url, resource_type):
+    """Never fetch external resources (the web font @import) while rasterizing."""
+    return b""
+
+
+@timed("rasterize")
+def rasterize(svg, fmt, width):
+    """Convert a rendered SVG to PNG or lossless WebP at the given width."""
+    cairosvg, Image = load_raster_libs()
+    png = cairosvg.svg2png(bytestring=svg, output_width=width, url_fetcher=offline_url_fetcher)
+    if fmt == 'png':
+        return png
+    out = io.BytesIO()
+    Image.open(io.BytesIO(png)).save(out, format='WEBP', lossless=True)
+    return out.getvalue()
+
+
+def iter_render(variant, country_counts, theme, scale, stops):
+    """Stream the SVG for a variant."""
+    if variant == 'list':
+        return iter_map_with_list(country_counts, theme, scale, stops)
+    return iter_map_only(country_counts, theme, scale, stops)
+
+
+def stream_and_store(key, chunks, last_modified, custom=False):
+    """Yield rendered chunks to the client, caching the full document once complete."""
+    parts = []
+    elapsed = 0.0
+    chunks = iter(chunks)
+    while True:
+        # Only the time spent rendering counts, not the time spent sending
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        elapsed += time.perf_counter() - start
+        if chunk is None:
+            break
+        parts.append(chunk)
+        yield chunk
+    record_stage("render", elapsed)
+    store_render(key, b"".join(parts), last_modified, custom)
+
+
+def server_timing_header(total):
+    """Format this request's stage timings (summed per stage) as a Server-Timing value."""
+    stages = {}
+    for stage, seconds in get_request_timings():
+        stages[stage] = stages.get(stage, 0.0) + seconds
+    stages["total"] = total
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages.items())
 
 
 @widget_bp.route('/api/heatmap')
@@ -448,28 +671,150 @@ def heatmap():
         repo: GitHub repo (owner/name)
         variant: 'list' (default) or 'map'
         theme: 'light' (default) or 'dark'
+        scale: 'log' (default), 'linear' or 'quantile'
+        stops: optional comma-separated hex colors replacing the theme's ramp
+        format: 'svg' (default), 'png' or 'webp'
+        width: raster width in pixels (defaults to the card width)
         refresh: '1' to force refresh cache
+        profile: '1' to profile the request (needs PROFILE_TOKEN in the
+            X-Profile-Token header); returns a JSON report
+        profile_top, profile_sort: report size and order ('tottime', 'cumtime', 'calls')
     """
+    if request.args.get('profile') == '1':
+        return profiled_heatmap()
+    return heatmap_response()
+
+
+def profiled_heatmap():
+    """Render the heatmap under the profilers (bypassing the render cache) and return the report."""
+    # Imported here so cProfile and pstats stay out of normal requests and cold starts
+    from profiling import SORT_KEYS, profile_call, save_profile
+
+    if not PROFILE_TOKEN:
+        return Response("Profiling is disabled", status=403)
+    # Header only: a query parameter would end up in access logs and Referer headers
+    token = request.headers.get('X-Profile-Token', '')
+    if not hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+        return Response("Invalid profile token", status=403)
+
+    top = max(1, min(request.args.get('profile_top', type=int) or PROFILE_TOP, 500))
+    sort = request.args.get('profile_sort', 'tottime')
+
+    def run():
+        response = heatmap_response(use_cache=False)
+        # Drain streamed bodies so the render happens inside the profile
+        response.get_data()
+        return response
+
+    response, report, profiler = profile_call(run, top, sort if sort in SORT_KEYS else 'tottime')
+    report = dict({
+        "params": dict(request.args),
+        "status": response.status_code,
+        "bytes": len(response.get_data()),
+        "server_timing": response.headers.get('Server-Timing'),
+    }, **report)
+    if PROFILE_DIR:
+        name = request.args.get('repo', 'heatmap').replace('/', '__')
+        report["saved"] = save_profile(report, profiler, PROFILE_DIR, name)
+    return Response(json.dumps(report, indent=2), mimetype='application/json',
+                    headers={'Cache-Control': 'no-store'})
+
+
+def heatmap_response(use_cache=True):
+    """Build the heatmap response for the current request."""
     repo = request.args.get('repo', 'sws2apps/organized-app')
-    variant = request.args.get('variant', 'list')
-    theme = request.args.get('theme', 'light')
+    variant = 'list' if request.args.get('variant', 'list') == 'list' else 'map'
+    theme = 'dark' if request.args.get('theme', 'light') == 'dark' else 'light'
+    scale = request.args.get('scale', DEFAULT_SCALE)
+    if scale not in SCALES:
+        scale = DEFAULT_SCALE
+    stops = parse_stops(request.args.get('stops'))
+    fmt = request.args.get('format', 'svg')
+    if fmt not in RASTER_FORMATS:
+        fmt = 'svg'
+    width = request.args.get('width', type=int) or CARD_LAYOUTS[variant]["width"]
+    width = min(max(width, MIN_RASTER_WIDTH), MAX_RASTER_WIDTH)
     force_refresh = request.args.get('refresh') == '1'
+
+    if fmt != 'svg' and fmt not in get_raster_formats():
+        return Response(f"{fmt} output is not available on this server", status=501)
     
+    start_request_timings()
+    started = time.perf_counter()
     try:
-        contributors = get_all_contributors(repo, force_refresh=force_refresh)
-        
-        country_counts = {}
-        for user in contributors:
-            code = resolve_country_code(user['location'])
-            if code:
-                country_counts[code] = country_counts.get(code, 0) + 1
+        # Expired repos are served from the stale snapshot and refreshed in the background
+        with timed("snapshot"):
+            snapshot = get_country_snapshot(repo, force_refresh=force_refresh, allow_stale=True)
+        cache_key = (repo, variant, theme, scale, stops, snapshot["source"], snapshot["resolver"])
+        # Arbitrary color stops and raster widths are kept apart from the default renders
+        custom = stops is not None
         
-        if variant == 'list':
-            svg_output = render_map_with_list(country_counts, theme)
+        entry = get_cached_render(cache_key, custom) if use_cache else None
+        encoding = request.accept_encodings.best_match(get_encodings())
+        if fmt != 'svg':
+            encoding = None
+            raster_key = cache_key + (fmt, width)
+            raster_custom = custom or width != CARD_LAYOUTS[variant]["width"]
+            raster = get_cached_render(raster_key, raster_custom) if use_cache else None
+            count_cache("raster", "hit" if raster is not None else "miss")
+            if raster is None:
+                if entry is None:
+                    with timed("render"):
+                        body = b"".join(iter_render(variant, snapshot["counts"], theme, scale, stops))
+                    entry = store_render(cache_key, body, snapshot["source"], custom)
+                svg = entry["body"]
+                # Concurrent requests for the same image share one rasterization
+                raster = single_flight(("raster",) + raster_key, lambda: store_render(
+                    raster_key, rasterize(svg, fmt, width), snapshot["source"], raster_custom))
+            entry = raster
         else:
-            svg_output = render_map_only(country_counts, theme)
-            
-        return Response(svg_output, mimetype='image/svg+xml', headers={'Cache-Control': 'no-cache, max-age=0'})
-
+            count_cache("render", "hit" if entry is not None else "miss")
+            if entry is None:
+                chunks = iter_render(variant, snapshot["counts"], theme, scale, stops)
+                if encoding is not None:
+                    # Compressed responses need the whole document
+                    with timed("render"):
+                        body = b"".join(chunks)
+                    entry = store_render(cache_key, body, snapshot["source"], custom)
+
+        if entry is None:
+            # Stream the render to the client; it is cached once fully written
+            response = Response(stream_and_store(cache_key, chunks, snapshot["source"], custom),
+                                mimetype='image/svg+xml')
+        elif encoding is None:
+            response = Response(entry["body"], mimetype=RASTER_FORMATS.get(fmt, 'image/svg+xml'))
+            response.set_etag(entry["etag"])
+        else:
+            response = Response(get_encoded_body(entry, encoding), mimetype='image/svg+xml')
+            response.headers['Content-Encoding'] = encoding
+            # Each representation gets its own validator
+            response.set_etag(f"{entry['etag']}-{encoding}")
+        response.vary.add('Accept-Encoding')
+        response.last_modified = snapshot["source"]
+        response.headers['Cache-Control'] = (
+            f"public, max-age={CACHE_MAX_AGE}, stale-while-revalidate={CACHE_STALE_WHILE_REVALIDATE}"
+        )
+        response.headers['Server-Timing'] = server_timing_header(time.perf_counter() - started)
+        return response.make_conditional(request)
+
+    except (TimeoutError, RepoUnavailable) as e:
+        # Nothing cached yet and no data now (another worker is still crawling, or
+        # GitHub failed): never render or cache an empty map for this
+        return Response(f"{e}, try again shortly", status=503,
+                        headers={'Retry-After': '30', 'Cache-Control': 'no-store'})
     except Exception as e:
         return Response(f"Internal Error: {e}", status=500)
+
+
+@widget_bp.route('/api/metrics')
+def metrics():
+    """Stage timings, cache counters and GitHub usage for this process, in Prometheus text format."""
+    gauges = {
+        "heatmap_render_cache_entries": ("Rendered images held in the in-memory cache.", len(render_cache)),
+        "heatmap_render_cache_bytes": ("Bytes held in the in-memory render cache.", render_cache.size),
+        "heatmap_custom_render_cache_entries": (
+            "Custom-palette and custom-width images held in memory.", len(custom_render_cache)),
+        "heatmap_custom_render_cache_bytes": (
+            "Bytes held in the custom-palette render cache.", custom_render_cache.size),
+    }
+    return Response(format_metrics(gauges), mimetype='text/plain; version=0.0.4')
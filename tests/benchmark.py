@@ -0,0 +1,302 @@
+"""
+Benchmarks for the resolution, aggregation and rendering hot paths, and cold start.
+
+Runs against a mocked GitHub (no network) in a temporary cache directory and
+writes the timings as JSON, so runs on different commits can be compared:
+
+    python tests/benchmark.py --output before.json
+    python tests/benchmark.py --output after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+API_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api'))
+sys.path.insert(0, API_DIR)
+
+# Keep the caches out of the working tree; utils opens them relative to the cwd
+ORIGINAL_CWD = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="heatmap-bench-"))
+os.environ.pop("GITHUB_TOKEN", None)
+os.environ["BACKGROUND_REFRESH"] = "0"
+
+import utils
+import widget
+from main import app
+
+# (city, region/country) pairs that GitHub users commonly write
+PLACES = [
+    ("Berlin", "Germany"), ("San Francisco", "CA"), ("Bengaluru", "India"),
+    ("São Paulo", "Brazil"), ("London", "UK"), ("Tokyo", "Japan"),
+    ("Lagos", "Nigeria"), ("Paris", "France"), ("Toronto", "Canada"),
+    ("Sydney", "Australia"), ("Shanghai", "China"), ("Kyiv", "Ukraine"),
+    ("Amsterdam", "The Netherlands"), ("Seoul", "South Korea"),
+    ("Mexico City", "Mexico"), ("Madrid", "Spain"), ("Helsinki", "Finland"),
+    ("Nairobi", "Kenya"), ("Jakarta", "Indonesia"), ("Austin", "Texas"),
+    ("Zürich", "Switzerland"), ("Warsaw", "Poland"), ("Hanoi", "Vietnam"),
+    ("Buenos Aires", "Argentina"), ("Cape Town", "South Africa"),
+]
+NOISE = ["Remote", "Earth", "Planet Earth", "localhost", "127.0.0.1", "Internet",
+         "Somewhere", "127.0.0.1 🏠", "Worldwide", "The Moon", "🌍", "Everywhere"]
+AREAS = ["Downtown", "North", "Old Town", "Bay Area", "Metro", "District 9", "Suburbs"]
+
+
+def build_corpus(size, seed=42):
+    """Generate realistic location strings: repeated common forms plus a unique long tail."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        city, country = rng.choice(PLACES)
+        roll = rng.random()
+        if roll < 0.35:
+            loc = f"{city}, {country}"
+        elif roll < 0.5:
+            loc = city
+        elif roll < 0.6:
+            loc = country
+        elif roll < 0.7:
+            loc = rng.choice([str.lower, str.upper])(f"{city}, {country}")
+        elif roll < 0.8:
+            loc = rng.choice(NOISE)
+        elif roll < 0.9:
+            other, _ = rng.choice(PLACES)
+            loc = f"{city} / {other}"
+        else:
+            # Long tail: strings that are unique to one user
+            loc = f"{rng.choice(AREAS)} {i}, {city}, {country}"
+        corpus.append(loc)
+    return corpus
+
+
+def measure(fn, repeat, setup=None):
+    """Time repeat calls of fn (setup runs untimed before each) and summarize in ms."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(times), 4),
+        "median_ms": round(statistics.median(times), 4),
+        "mean_ms": round(statistics.fmean(times), 4),
+    }
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload, headers=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = headers or {}
+        self.content = json.dumps(payload).encode()
+
+    def json(self):
+        return self._payload
+
+
+class MockGitHub:
+    """Answers contributor pages and user lookups from generated data, in-process."""
+
+    def __init__(self, contributors, corpus):
+        self.contributors = contributors
+        self.corpus = corpus
+
+    def request(self, method, url, **kwargs):
+        if "/contributors" in url:
+            page = int(url.rsplit("page=", 1)[1])
+            repo = url.split("/repos/", 1)[1].split("/contributors", 1)[0]
+            start = (page - 1) * 100
+            logins = range(start, min(start + 100, self.contributors))
+            return FakeResponse(200, [
+                {"login": f"{repo}-u{i}", "url": f"https://api.github.com/users/{repo}-u{i}"}
+                for i in logins
+            ], {"ETag": f'"{repo}-{page}"'})
+        login = url.rsplit("/", 1)[1]
+        index = int(login.rsplit("-u", 1)[1])
+        return FakeResponse(200, {"location": self.corpus[index % len(self.corpus)]})
+
+
+def bench_resolution(corpus, repeat):
+    results = {}
+
+    def resolve_all():
+        for loc in corpus:
+            utils.resolve_country_code(loc)
+
+    results["resolve_country_code.cold"] = measure(
+        resolve_all, repeat, setup=utils.fuzzy_country_code.cache_clear)
+    results["resolve_country_code.warm"] = measure(resolve_all, repeat)
+
+    def resolve_cached():
+        for loc in corpus:
+            utils.resolve_country_code_cached(loc)
+
+    resolve_cached()
+    results["resolve_country_code_cached.warm"] = measure(resolve_cached, repeat)
+    for stats in results.values():
+        stats["items"] = len(corpus)
+    return results
+
+
+def bench_aggregation(corpus, repeat):
+    # Contributors as stored in repo_cache: with a persisted country, and legacy ones without
+    persisted = [dict(utils.make_location_entry(loc), login=f"u{i}") for i, loc in enumerate(corpus)]
+    legacy = [{"login": f"u{i}", "location": loc} for i, loc in enumerate(corpus)]
+    results = {
+        "aggregate_country_counts.persisted": measure(
+            lambda: utils.aggregate_country_counts(persisted), repeat),
+        "aggregate_country_counts.legacy": measure(
+            lambda: utils.aggregate_country_counts(legacy), repeat),
+    }
+    for stats in results.values():
+        stats["items"] = len(corpus)
+    return results
+
+
+def bench_rendering(sizes, repeat):
+    results = {}
+    codes = sorted({c for c in widget.get_map_template()["fill_codes"] if c})
+    rng = random.Random(3)
+    for size in sizes:
+        counts = {code: rng.randint(1, 400) for code in codes[:size]}
+        for name, render in (("render_map_with_list", widget.render_map_with_list),
+                             ("render_map_only", widget.render_map_only)):
+            results[f"{name}.{len(counts)}_countries"] = measure(lambda: render(counts, 'light'), repeat)
+    return results
+
+
+def bench_heatmap(repeat, contributors):
+    results = {}
+    client = app.test_client()
+    repos = iter(range(10 ** 9))
+
+    def cold():
+        # A repo never seen before: crawl, user lookups, resolution and render
+        client.get(f"/api/heatmap?repo=bench/cold{next(repos)}").get_data()
+
+    results["heatmap.cold"] = measure(cold, repeat)
+    results["heatmap.cold"]["contributors"] = contributors
+
+    client.get("/api/heatmap?repo=bench/warm").get_data()
+    results["heatmap.warm"] = measure(
+        lambda: client.get("/api/heatmap?repo=bench/warm").get_data(), repeat)
+    results["heatmap.warm_gzip"] = measure(
+        lambda: client.get("/api/heatmap?repo=bench/warm",
+                           headers={"Accept-Encoding": "gzip"}).get_data(), repeat)
+    etag = client.get("/api/heatmap?repo=bench/warm").headers["ETag"]
+    results["heatmap.not_modified"] = measure(
+        lambda: client.get("/api/heatmap?repo=bench/warm",
+                           headers={"If-None-Match": etag}).get_data(), repeat)
+    return results
+
+
+# Run in a fresh interpreter: time each cold-start phase and print them as JSON
+STARTUP_SCRIPT = """
+import sys, json, time
+sys.path.insert(0, %r)
+t0 = time.perf_counter()
+import main, utils, widget
+t1 = time.perf_counter()
+utils.resolve_country_code("Bavaria")
+t2 = time.perf_counter()
+widget.render_map_with_list({"us": 40, "de": 12, "in": 7})
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "first_resolve": t2 - t1, "first_render": t3 - t2, "total": t3 - t0}))
+"""
+
+
+def bench_startup(runs):
+    """Cold-start phases in fresh processes, with and without the prebuilt artifacts."""
+    results = {}
+    for suffix, prebuilt in (("", "1"), (".no_prebuilt", "0")):
+        phases = {}
+        for _ in range(runs):
+            env = dict(os.environ, PREBUILT_ARTIFACTS=prebuilt)
+            out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT % API_DIR], env=env,
+                                 capture_output=True, text=True, check=True).stdout
+            for phase, seconds in json.loads(out.strip().splitlines()[-1]).items():
+                phases.setdefault(phase, []).append(seconds * 1000)
+        for phase, times in phases.items():
+            results[f"startup.{phase}{suffix}"] = {
+                "runs": runs,
+                "min_ms": round(min(times), 4),
+                "median_ms": round(statistics.median(times), 4),
+                "mean_ms": round(statistics.fmean(times), 4),
+            }
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the median change against an earlier run."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\n{'benchmark':<45} {'before':>10} {'after':>10} {'change':>8}")
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        before, after = old["median_ms"], stats["median_ms"]
+        change = (after - before) / before * 100 if before else 0
+        print(f"{name:<45} {before:>10.3f} {after:>10.3f} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the heatmap hot paths.")
+    parser.add_argument('--output', default=None, help="write results to this JSON file")
+    parser.add_argument('--compare', default=None, help="earlier results JSON to compare against")
+    parser.add_argument('--corpus-size', type=int, default=20000, help="synthetic location strings")
+    parser.add_argument('--contributors', type=int, default=300, help="contributors per mocked repo")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument('--startup-runs', type=int, default=5, help="fresh processes per startup benchmark (0 to skip)")
+    args = parser.parse_args()
+    output = os.path.join(ORIGINAL_CWD, args.output) if args.output else None
+    baseline = os.path.join(ORIGINAL_CWD, args.compare) if args.compare else None
+
+    corpus = build_corpus(args.corpus_size)
+    utils.session.request = MockGitHub(args.contributors, corpus).request
+
+    results = {}
+    results.update(bench_resolution(corpus, args.repeat))
+    results.update(bench_aggregation(corpus, args.repeat))
+    results.update(bench_rendering((0, 10, 50, 150, 250), args.repeat * 4))
+    results.update(bench_heatmap(args.repeat * 4, args.contributors))
+    if args.startup_runs:
+        results.update(bench_startup(args.startup_runs))
+
+    for name, stats in results.items():
+        print(f"{name:<45} median {stats['median_ms']:>10.3f} ms  (min {stats['min_ms']:.3f})")
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "params": vars(args),
+        "results": results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+Local stand-in for the GitHub API, for load and cold-start testing offline.
+
+Serves paginated /repos/{owner}/{name}/contributors, /users/{login} and the
+GraphQL user-location query from deterministic generated fixtures, with
+optional latency, rate-limit headers and error injection.
+
+    python tests/fake_github.py --port 8765 --repo big/repo=10000 --latency 50
+    GITHUB_API_URL=http://127.0.0.1:8765 python api/main.py
+
+It can also run in-process: start_server(...) returns the server and its base URL.
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Locations handed out to generated users (None: no location on the profile)
+LOCATIONS = [
+    "Berlin, Germany", "San Francisco, CA", "Bengaluru, India", "São Paulo, Brazil",
+    "London, UK", "Tokyo", "Lagos, Nigeria", "Paris", "Toronto, Canada", "Sydney",
+    "Shanghai, China", "Kyiv, Ukraine", "Amsterdam", "Seoul, South Korea", "Mexico City",
+    "Madrid, Spain", "Helsinki, Finland", "Nairobi", "Jakarta, Indonesia", "Austin, TX",
+    "Remote", "Earth", None, None, None,
+]
+
+
+class FakeGitHub:
+    """Fixture data, rate-limit state and fault injection settings shared by all handlers."""
+
+    def __init__(self, repos=None, default_contributors=250, latency=0.0, jitter=0.0,
+                 error_rate=0.0, throttle_rate=0.0, rate_limit=5000, rate_window=3600, seed=0,
+                 users=None, missing_users=(), graphql_errors=()):
+        self.repos = dict(repos or {})
+        # Fixed {login: location} overrides, logins that do not exist (REST 404, GraphQL null)
+        # and logins GraphQL answers with null although REST knows them
+        self.users = dict(users or {})
+        self.missing_users = set(missing_users)
+        self.graphql_errors = set(graphql_errors)
+        self.default_contributors = default_contributors
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.window_start = time.time()
+        self.used = 0
+        self.stats = {"requests": 0, "contributors": 0, "users": 0, "graphql": 0,
+                      "not_modified": 0, "errors": 0, "throttled": 0, "rate_limited": 0}
+
+    def contributor_count(self, repo):
+        return self.repos.get(repo, self.default_contributors)
+
+    def login(self, repo, index):
+        return f"{repo.replace('/', '-')}-u{index}"
+
+    def location(self, login):
+        if login in self.users:
+            return self.users[login]
+        digest = hashlib.sha1(f"{self.seed}:{login}".encode()).digest()
+        return LOCATIONS[digest[0] % len(LOCATIONS)]
+
+    def page_etag(self, repo, page):
+        return '"' + hashlib.sha1(f"{self.seed}:{repo}:{page}:{self.contributor_count(repo)}".encode()).hexdigest() + '"'
+
+    def charge(self, counts=True):
+        """Account for one request; return (remaining, reset) or None once the limit is spent."""
+        with self.lock:
+            now = time.time()
+            if now - self.window_start >= self.rate_window:
+                self.window_start, self.used = now, 0
+            reset = int(self.window_start + self.rate_window)
+            if counts:
+                if self.used >= self.rate_limit:
+                    return None, reset
+                self.used += 1
+            return self.rate_limit - self.used, reset
+
+    def roll(self, rate):
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    server_version = "FakeGitHub/1.0"
+
+    @property
+    def github(self):
+        return self.server.github
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def base_url(self):
+        return f"http://{self.headers.get('Host') or '%s:%s' % self.server.server_address[:2]}"
+
+    def handle_request(self, respond, counts=True):
+        """Apply latency, fault injection and rate limiting around a route handler."""
+        github = self.github
+        with github.lock:
+            github.stats["requests"] += 1
+        if github.latency or github.jitter:
+            time.sleep(github.latency + github.random.uniform(0, github.jitter))
+
+        if github.roll(github.error_rate):
+            with github.lock:
+                github.stats["errors"] += 1
+            return self.send_json(502, {"message": "Server Error"})
+        if github.roll(github.throttle_rate):
+            with github.lock:
+                github.stats["throttled"] += 1
+            return self.send_json(429, {"message": "You have exceeded a secondary rate limit."},
+                                  {"Retry-After": "1"})
+
+        remaining, reset = github.charge(counts)
+        limit_headers = {
+            "X-RateLimit-Limit": str(github.rate_limit),
+            "X-RateLimit-Remaining": str(remaining or 0),
+            "X-RateLimit-Reset": str(reset),
+        }
+        if remaining is None:
+            with github.lock:
+                github.stats["rate_limited"] += 1
+            return self.send_json(403, {"message": "API rate limit exceeded"}, limit_headers)
+        status, payload, headers = respond()
+        headers.update(limit_headers)
+        self.send_json(status, payload, headers)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        github = self.github
+
+        if url.path == "/_stats":
+            with github.lock:
+                stats = dict(github.stats, rate_limit_used=github.used)
+            return self.send_json(200, stats)
+
+        match = re.fullmatch(r"/repos/([^/]+/[^/]+)/contributors", url.path)
+        if match:
+            repo = match.group(1)
+            query = parse_qs(url.query)
+            per_page = min(int(query.get("per_page", ["30"])[0]), 100)
+            page = max(int(query.get("page", ["1"])[0]), 1)
+            etag = github.page_etag(repo, page)
+            if self.headers.get("If-None-Match") == etag:
+                # Conditional hits do not count against GitHub's rate limit
+                with github.lock:
+                    github.stats["not_modified"] += 1
+                return self.handle_request(lambda: (304, None, {"ETag": etag}), counts=False)
+
+            def contributors():
+                with github.lock:
+                    github.stats["contributors"] += 1
+                start = (page - 1) * per_page
+                end = min(start + per_page, github.contributor_count(repo))
+                base = self.base_url()
+                data = []
+                for i in range(start, end):
+                    login = github.login(repo, i)
+                    data.append({"login": login, "url": f"{base}/users/{login}",
+                                 "contributions": github.contributor_count(repo) - i})
+                return 200, data, {"ETag": etag}
+
+            return self.handle_request(contributors)
+
+        match = re.fullmatch(r"/users/([^/]+)", url.path)
+        if match:
+            login = match.group(1)
+
+            def user():
+                with github.lock:
+                    github.stats["users"] += 1
+                if login in github.missing_users:
+                    return 404, {"message": "Not Found"}, {}
+                return 200, {"login": login, "location": github.location(login)}, {}
+
+            return self.handle_request(user)
+
+        self.send_json(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/graphql":
+            return self.send_json(404, {"message": "Not Found"})
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        github = self.github
+
+        def graphql():
+            with github.lock:
+                github.stats["graphql"] += 1
+            # Logins arrive as variables l0, l1, ... and are answered under aliases u0, u1, ...
+            data = {}
+            for name, login in (payload.get("variables") or {}).items():
+                if login in github.missing_users or login in github.graphql_errors:
+                    data["u" + name[1:]] = None
+                else:
+                    data["u" + name[1:]] = {"location": github.location(login)}
+            return 200, {"data": data}, {}
+
+        self.handle_request(graphql)
+
+
+def start_server(host="127.0.0.1", port=0, **options):
+    """Start the stand-in in a daemon thread and return (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), FakeGitHubHandler)
+    server.daemon_threads = True
+    server.github = FakeGitHub(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def parse_repo(value):
+    """Parse 'owner/name=count' into (repo, count)."""
+    repo, _, count = value.partition("=")
+    return repo, int(count or 250)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a fake GitHub API from generated fixtures.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--repo', action='append', type=parse_repo, default=[],
+                        help="owner/name=contributors (repeatable)")
+    parser.add_argument('--contributors', type=int, default=250, help="contributors for any other repo")
+    parser.add_argument('--latency', type=float, default=0, help="added latency per request (ms)")
+    parser.add_argument('--jitter', type=float, default=0, help="random extra latency up to this (ms)")
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of requests answered with 502")
+    parser.add_argument('--throttle-rate', type=float, default=0, help="fraction answered with 429 Retry-After")
+    parser.add_argument('--rate-limit', type=int, default=5000, help="requests per rate-limit window")
+    parser.add_argument('--rate-window', type=int, default=3600, help="rate-limit window (seconds)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server, base_url = start_server(
+        args.host, args.port, repos=dict(args.repo), default_contributors=args.contributors,
+        latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, rate_limit=args.rate_limit,
+        rate_window=args.rate_window, seed=args.seed)
+    print(f"Fake GitHub API at {base_url} (stats at {base_url}/_stats)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,197 @@
+import sys
+import os
+import time
+import tempfile
+import threading
+
+from fake_github import start_server
+
+# Point the app at a local fake GitHub and keep its caches out of the working tree
+server, base_url = start_server(repos={"busy/repo": 350, "flaky/repo": 30, "stale/repo": 120,
+                                       "huge/repo": 10000})
+github = server.github
+os.environ["GITHUB_API_URL"] = base_url
+os.environ["BACKGROUND_REFRESH"] = "0"
+os.environ.pop("GITHUB_TOKEN", None)
+tmp_dir = tempfile.mkdtemp(prefix="heatmap-test-")
+os.chdir(tmp_dir)
+
+# Add the api directory to sys.path, as main.py does for its modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import utils
+import widget
+from main import app
+
+# Fail fast instead of backing off on injected errors
+utils.MAX_RETRIES = 0
+
+
+def sqlite_round_trip():
+    legacy = os.path.join(tmp_dir, "legacy.json")
+    utils.save_json(legacy, {"a": 1, "b": [1, 2]})
+    db = os.path.join(tmp_dir, "round-trip.sqlite3")
+
+    cache = utils.SqliteCache(db, "t", legacy_file=legacy)
+    imported = cache.get("a") == 1 and cache["b"] == [1, 2]
+    cache.update({"a": {"x": 1}, "c": "v"})
+    upserted = cache.get("a") == {"x": 1} and cache.get("c") == "v"
+    memo_reused = cache.get("a") is cache.get("a")
+    cache.set("short", 1, ttl=0.05)
+    time.sleep(0.1)
+    expired = "short" not in cache and "c" in cache
+
+    # A second connection, as another worker process would open; opening purges expired rows
+    other = utils.SqliteCache(db, "t", legacy_file=legacy)
+    imported_once = other.get("a") == {"x": 1}
+    purged = other.connect().execute("SELECT 1 FROM t WHERE key = 'short'").fetchone() is None
+    other.set("a", 2)
+    sees_other_write = cache.get("a") == 2
+
+    cache.update({f"k{i}": i for i in range(utils.DECODED_CACHE_SIZE + 50)})
+    for i in range(utils.DECODED_CACHE_SIZE + 50):
+        cache.get(f"k{i}")
+    memo_bounded = len(cache.decoded) == utils.DECODED_CACHE_SIZE and "a" not in cache.decoded
+    return (imported and upserted and memo_reused and expired and imported_once and purged
+            and sees_other_write and memo_bounded)
+
+
+def json_round_trip():
+    path = os.path.join(tmp_dir, "round-trip.json")
+    cache = utils.JsonCache(path)
+    cache["k"] = {"location": "Tokyo"}
+    cache.save()
+    return utils.JsonCache(path).get("k") == {"location": "Tokyo"}
+
+
+def single_crawl():
+    """20 concurrent requests for an uncached repo share one crawl."""
+    before = dict(github.stats)
+    github.latency = 0.005
+    barrier = threading.Barrier(20)
+    results = []
+
+    def request():
+        barrier.wait()
+        results.append(len(utils.get_all_contributors("busy/repo")))
+
+    threads = [threading.Thread(target=request) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    github.latency = 0
+    return (results == [350] * 20
+            and github.stats["contributors"] - before["contributors"] == 4
+            and github.stats["users"] - before["users"] == 350)
+
+
+def failed_users_rechecked():
+    """Failed lookups are not cached for good: they are retried once FAILED_LOOKUP_TTL passes."""
+    utils.FAILED_LOOKUP_TTL = 1
+    headers = utils.github_headers()
+    pages = utils.fetch_contributor_pages("flaky/repo", headers, [])
+    github.error_rate = 1.0
+    utils.update_contributor_data("flaky/repo", {}, pages, headers, time.time())
+    github.error_rate = 0
+    all_failed = all(utils.user_locations[u["login"]]["status"] == "failed"
+                     for u in utils.repo_cache["flaky/repo"]["data"])
+
+    before = dict(github.stats)
+    utils.get_all_contributors("flaky/repo")
+    not_yet = github.stats["users"] == before["users"]
+    time.sleep(1.1)
+    utils.get_all_contributors("flaky/repo")
+    rechecked = (github.stats["users"] - before["users"] == 30
+                 and github.stats["contributors"] == before["contributors"])
+    resolved = all(utils.user_locations[u["login"]]["status"] != "failed"
+                   for u in utils.repo_cache["flaky/repo"]["data"])
+    return all_failed and not_yet and rechecked and resolved
+
+
+def stale_kept_on_failure():
+    """A refresh that fails keeps serving the previous entry instead of storing an empty one."""
+    utils.get_all_contributors("stale/repo")
+    entry = utils.repo_cache["stale/repo"]
+    entry["timestamp"] -= utils.REPO_CACHE_TTL
+    utils.repo_cache["stale/repo"] = entry
+    github.error_rate = 1.0
+    served = len(utils.get_all_contributors("stale/repo"))
+    github.error_rate = 0
+    kept = utils.repo_cache["stale/repo"]
+    return (served == 120 and kept["data"] == entry["data"] and kept["timestamp"] == entry["timestamp"]
+            and not utils.repo_needs_refresh(kept, time.time()))
+
+
+def unavailable_not_cached():
+    """A repo never seen before whose first crawl fails is answered 503 and leaves nothing cached."""
+    client = app.test_client()
+    renders = len(widget.render_cache)
+    github.error_rate = 1.0
+    resp = client.get("/api/heatmap?repo=down/repo")
+    github.error_rate = 0
+    return (resp.status_code == 503 and resp.headers.get("Cache-Control") == "no-store"
+            and "Retry-After" in resp.headers and len(widget.render_cache) == renders
+            and utils.repo_cache.get("down/repo") is None)
+
+
+def conditional_requests():
+    """Every encoding gets its own ETag; both validators yield 304."""
+    client = app.test_client()
+    url = "/api/heatmap?repo=busy/repo"
+    # The first response is streamed; later ones come from the render cache
+    client.get(url).get_data()
+    ok = True
+    etags = {}
+    for encoding in widget.get_encodings() + ("identity",):
+        resp = client.get(url, headers={"Accept-Encoding": encoding})
+        etag = resp.headers["ETag"]
+        etags[encoding] = etag
+        not_modified = client.get(url, headers={"Accept-Encoding": encoding, "If-None-Match": etag})
+        not_modified_since = client.get(url, headers={"Accept-Encoding": encoding,
+                                                      "If-Modified-Since": resp.headers["Last-Modified"]})
+        ok = ok and resp.status_code == 200 and not_modified.status_code == 304 \
+            and not_modified_since.status_code == 304
+    mismatched = client.get(url, headers={"Accept-Encoding": "identity", "If-None-Match": etags["gzip"]})
+    return ok and len(set(etags.values())) == len(etags) and mismatched.status_code == 200
+
+
+def cold_crawl():
+    """A 10,000-contributor repo crawled cold with a token, through GITHUB_API_URL."""
+    before = dict(github.stats)
+    utils.GITHUB_TOKEN = "test"
+    try:
+        counts = utils.get_country_counts("huge/repo")
+    finally:
+        utils.GITHUB_TOKEN = None
+    spent = {name: github.stats[name] - before[name] for name in before}
+    # 100 full pages plus the empty one that ends the list; locations in batches of 100
+    return (utils.GITHUB_API_URL == base_url
+            and len(utils.repo_cache["huge/repo"]["data"]) == 10000
+            and spent["contributors"] == 101 and spent["graphql"] == 100 and spent["users"] == 0
+            and 0 < sum(counts.values()) <= 10000)
+
+
+checks = [
+    ("SqliteCache round-trip", sqlite_round_trip()),
+    ("JsonCache round-trip", json_round_trip()),
+    ("20 threads, one crawl", single_crawl()),
+    ("failed users re-checked", failed_users_rechecked()),
+    ("stale kept on failure", stale_kept_on_failure()),
+    ("503 when GitHub is down", unavailable_not_cached()),
+    ("304 per encoding", conditional_requests()),
+    ("10k contributors, cold", cold_crawl()),
+]
+server.shutdown()
+
+failed = 0
+for name, ok in checks:
+    print(f"{name:<30} | {'✅ PASS' if ok else '❌ FAIL'}")
+    if not ok:
+        failed += 1
+
+if failed:
+    print(f"Fake GitHub stats: {github.stats}")
+    sys.exit(1)
+else:
+    sys.exit(0)
@@ -0,0 +1,62 @@
+import sys
+import os
+
+from fake_github import start_server
+
+# Fixed fixtures for the local fake GitHub
+USERS = {
+    "alice": "Berlin, Germany",
+    "bob": None,
+    "carol": "Tokyo",
+    "dave": "Lagos, Nigeria",
+}
+# Users the GraphQL endpoint "fails" on, forcing the REST fallback
+GRAPHQL_FAILS = {"dave"}
+
+server, base_url = start_server(users=USERS, missing_users={"ghost"}, graphql_errors=GRAPHQL_FAILS)
+# The GraphQL endpoint is derived from the REST API root
+os.environ["GITHUB_API_URL"] = base_url
+os.environ.pop("GITHUB_GRAPHQL_URL", None)
+
+# Add the project root to sys.path to import api.utils
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api import utils
+
+utils.GRAPHQL_BATCH_SIZE = 2
+
+headers = {"Accept": "application/vnd.github+json", "Authorization": "token test"}
+logins = ["alice", "bob", "carol", "dave", "ghost"]
+pending = {login: f"{base_url}/users/{login}" for login in logins}
+
+results = utils.fetch_missing_locations(pending, headers)
+server.shutdown()
+requests_seen = server.github.stats
+
+expected = {
+    "alice": "Berlin, Germany",
+    "bob": None,
+    "carol": "Tokyo",
+    "dave": "Lagos, Nigeria",
+    "ghost": None,
+}
+
+checks = [
+    ("GraphQL URL from API root", utils.GITHUB_GRAPHQL_URL == f"{base_url}/graphql"),
+    ("locations match", results == expected),
+    ("3 GraphQL batches of 2", requests_seen["graphql"] == 3),
+    ("REST only for failed logins", requests_seen["users"] == 2),
+]
+
+failed = 0
+for name, ok in checks:
+    print(f"{name:<30} | {'✅ PASS' if ok else '❌ FAIL'}")
+    if not ok:
+        failed += 1
+
+if failed:
+    print(f"Results: {results}")
+    print(f"Requests: {requests_seen}")
+    sys.exit(1)
+else:
+    sys.exit(0)
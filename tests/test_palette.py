@@ -0,0 +1,56 @@
+import sys
+import os
+import math
+
+# Add the project root to sys.path to import api.palette
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api import palette
+
+
+def legacy_color(count, max_count, start, end, empty):
+    """The per-call log interpolation the lookup tables replace."""
+    if count == 0:
+        return empty
+    intensity = math.log(count) / math.log(max_count) if max_count > 1 and count > 1 else 0
+    return "#" + "".join(f"{int(s + (e - s) * intensity):02x}" for s, e in zip(start, end))
+
+
+def log_tables_match():
+    for theme, (start, end) in palette.THEME_STOPS.items():
+        empty = palette.EMPTY_COLORS[theme]
+        for max_count in range(1, 300):
+            table = palette.color_table(theme, max_count, values=tuple(range(1, max_count + 1)))
+            for count in range(max_count + 1):
+                if table[count] != legacy_color(count, max_count, start, end, empty):
+                    return False
+    return True
+
+
+linear = palette.color_table('light', 11, 'linear', values=tuple(range(1, 12)))
+quantile = palette.get_palette('light', {'us': 1000, 'de': 2, 'fr': 1}, 'quantile')
+stops = palette.parse_stops('#000,808080,ffffff')
+custom = palette.color_table('light', 3, 'linear', stops, (1, 2, 3))
+sparse = palette.get_palette('light', {'us': 10 ** 6, 'de': 3, 'fr': 3})
+
+checks = [
+    ("log scale matches legacy", log_tables_match()),
+    ("linear midpoint", linear[6] == palette.interpolate(palette.THEME_STOPS['light'], 0.5)),
+    ("quantile spreads ranks", (quantile[1], quantile[2], quantile[1000]) == (
+        palette.interpolate(palette.THEME_STOPS['light'], 0),
+        palette.interpolate(palette.THEME_STOPS['light'], 0.5),
+        palette.interpolate(palette.THEME_STOPS['light'], 1))),
+    ("custom stops", custom == {0: '#ffffff', 1: '#000000', 2: '#808080', 3: '#ffffff'}),
+    ("only present counts built", sorted(sparse) == [0, 3, 10 ** 6]
+        and sparse[3] == legacy_color(3, 10 ** 6, *palette.THEME_STOPS['light'], palette.EMPTY_COLORS['light'])),
+    ("single-count helper", palette.count_color('dark', 7, 40) == palette.get_palette('dark', {'us': 40, 'de': 7})[7]),
+    ("invalid stops rejected", palette.parse_stops('red,blue') is None and palette.parse_stops('fff') is None),
+]
+
+failed = 0
+for name, ok in checks:
+    print(f"{name:<30} | {'✅ PASS' if ok else '❌ FAIL'}")
+    if not ok:
+        failed += 1
+
+sys.exit(1 if failed else 0)